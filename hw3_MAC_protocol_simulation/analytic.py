@@ -0,0 +1,178 @@
+import copy
+import math
+
+import protocols
+from sweep import T_95
+
+PROTOCOLS = ("aloha", "slotted_aloha", "csma", "csma_cd", "csma_ca")
+
+# The formulas only cover low loads: expected_rates is valid up to this
+# fraction of a protocol's capacity, about G 0.1-0.2 (the notebook's default
+# setting, G = 1.05, is far above it). They assume Poisson attempts, and
+# above it the simulator's few hosts with bounded random backoff deliver far
+# more than they predict.
+VALID_LOAD = 0.5
+
+# length of the pilot simulation that stands in for expected_rates above VALID_LOAD
+PILOT_TICKS = 20_000
+
+
+def offered_load(setting):
+    ### Packets generated per packet_time over the whole run (G of a stable system)
+    return setting.host_num * setting.packet_num * setting.packet_time / setting.total_time
+
+
+def aloha_rates(G, n):
+    """
+    Pure ALOHA with n hosts attempting G packets per packet_time in total.
+
+    A packet succeeds when no other host starts within one packet_time before
+    or after it, which gives G(1 - G/n)^(2(n-1)) and G·e^-2G for n -> ∞.
+    The channel is idle when no transmission is in progress.
+    """
+    p = min(G / n, 1)
+    success = G * (1 - p) ** (2 * (n - 1))
+    idle = (1 - p) ** n
+    return success, idle
+
+
+def slotted_aloha_rates(G, n):
+    ### Slotted ALOHA: G(1 - G/n)^(n-1) successes per slot, G·e^-G for n -> ∞
+    p = min(G / n, 1)
+    return G * (1 - p) ** (n - 1), (1 - p) ** n
+
+
+def csma_rates(G, a, n):
+    """
+    Non-persistent CSMA (Kleinrock and Tobagi) with G attempts per packet_time
+    and a carrier-sense delay of a packet_time.
+
+    A renewal argument over one idle + busy cycle: the idle period lasts 1/G
+    on average, the busy period 1 + a - (1 - e^-aG)/G, and the cycle carries
+    a success when no other host starts in the first a of it. A host never
+    collides with itself, so only the other n - 1 hosts' share of G counts.
+    """
+    p = math.exp(-a * G * (n - 1) / n)
+    cycle = G * (1 + a) + p
+    return G * p / cycle, 1 / cycle
+
+
+def csma_cd_rates(G, a, n):
+    ### CSMA cycle with every collided transmission stopped after the 2a it takes to hear the other host
+    p = math.exp(-a * G * (n - 1) / n)
+    cycle = G * (p + (1 - p) * 2 * a) + 1
+    return G * p / cycle, 1 / cycle
+
+
+def rates(setting, protocol, G):
+    ### (success, idle, collision) rates of a protocol at attempt rate G
+    a = (setting.link_delay + 1) / setting.packet_time
+    if protocol == "aloha":
+        success, idle = aloha_rates(G, setting.host_num)
+    elif protocol == "slotted_aloha":
+        success, idle = slotted_aloha_rates(G, setting.host_num)
+    elif protocol == "csma":
+        success, idle = csma_rates(G, a, setting.host_num)
+    elif protocol == "csma_cd":
+        success, idle = csma_cd_rates(G, a, setting.host_num)
+    elif protocol == "csma_ca":
+        # no model of its own: at low load CSMA/CA matches non-persistent CSMA
+        success, idle = csma_rates(G, a, setting.host_num)
+    else:
+        raise ValueError(f"unknown protocol {protocol!r}")
+    success = min(success, 1.0)
+    idle = min(idle, 1.0 - success)
+    return success, idle, 1.0 - success - idle
+
+
+def capacity(setting, protocol, G_max=50.0, steps=2000):
+    ### (G, success) at the maximum success rate, found on a grid refined around the best point
+    low, high = 0.0, G_max
+    for _ in range(3):
+        step = (high - low) / steps
+        best = max((low + k * step for k in range(1, steps + 1)), key=lambda G: rates(setting, protocol, G)[0])
+        low, high = max(best - step, 0.0), best + step
+    return best, rates(setting, protocol, best)[0]
+
+
+def in_range(setting, protocol):
+    ### Whether the offered load is low enough for expected_rates
+    return offered_load(setting) <= VALID_LOAD * capacity(setting, protocol)[1]
+
+
+def expected_rates(setting, protocol):
+    """
+    Expected (success, idle, collision) rates of a low-load simulation.
+
+    Every packet is delivered, and the attempt rate G is the smallest root of
+    success(G) = offered load, found by bisection. Only valid up to
+    VALID_LOAD of the protocol's capacity, where the success rate is within
+    about 0.01 of the simulator's. The collision rate is only an order of
+    magnitude (CSMA predicts several times the simulated rate) and CSMA/CA
+    has no model of its own. Raises ValueError above that load.
+    """
+    if not in_range(setting, protocol):
+        raise ValueError(f"offered load {offered_load(setting):.3f} is too high for the {protocol} estimate")
+    load = offered_load(setting)
+    G_max, S_max = capacity(setting, protocol)
+    low, high = 0.0, G_max
+    for _ in range(60):
+        G = (low + high) / 2
+        if rates(setting, protocol, G)[0] < load:
+            low = G
+        else:
+            high = G
+    return rates(setting, protocol, high)
+
+
+def pilot_rates(setting, protocol, ticks=PILOT_TICKS):
+    ### Rates of one short protocols.py run of setting at the same offered load
+    pilot = scaled(setting, min(ticks, setting.total_time))
+    pilot.profile = False
+    return getattr(protocols, protocol)(pilot)
+
+
+def sizing_rate(setting, protocol):
+    ### The rate with the largest variance, from expected_rates at low load and from a pilot run above it
+    estimate = expected_rates(setting, protocol) if in_range(setting, protocol) else pilot_rates(setting, protocol)
+    return max(estimate, key=lambda x: x * (1 - x))
+
+
+def run_std(setting, protocol, total_time=None):
+    """
+    Estimated standard deviation of the rates of one run of total_time ticks.
+
+    Each packet_time is treated as one independent trial, so a rate r has a
+    variance of r(1 - r) · packet_time / total_time. The largest of the three
+    rates' deviations is returned.
+    """
+    total_time = total_time or setting.total_time
+    r = sizing_rate(setting, protocol)
+    return math.sqrt(r * (1 - r) * setting.packet_time / total_time)
+
+
+def required_replications(setting, protocol, half_width, max_replications=1000):
+    ### Smallest number of runs of setting whose 95% confidence interval is within half_width
+    std = run_std(setting, protocol)
+    for k in range(2, max_replications + 1):
+        t = T_95[k - 2] if k - 1 <= len(T_95) else 1.96
+        if t * std / math.sqrt(k) <= half_width:
+            return k
+    return max_replications
+
+
+def required_ticks(setting, protocol, half_width, replications=1):
+    ### total_time that gives a 95% confidence interval within half_width with this many runs
+    t = T_95[replications - 2] if 2 <= replications <= len(T_95) + 1 else 1.96
+    r = sizing_rate(setting, protocol)
+    ticks = t * t * r * (1 - r) * setting.packet_time / (half_width * half_width * replications)
+    # at least a few packets per host so the arrivals are still meaningful
+    return max(math.ceil(ticks), 10 * setting.packet_time * setting.host_num)
+
+
+def scaled(setting, total_time):
+    ### Copy of setting with total_time changed and packet_num scaled to keep the offered load
+    s = copy.copy(setting)
+    s.packet_num = max(1, round(setting.packet_num * total_time / setting.total_time))
+    s.total_time = total_time
+    return s
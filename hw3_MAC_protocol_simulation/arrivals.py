@@ -0,0 +1,85 @@
+import random
+
+import numpy as np
+
+ARRIVAL_PROCESSES = ("uniform", "poisson", "bernoulli")
+
+
+class Arrivals:
+    """
+    Sorted arrival ticks of one host, consumed through a cursor.
+
+    Replaces list.pop(0) on the gen_packets lists: pop(t) only moves the
+    cursor. A tick can hold several arrivals (poisson process).
+    """
+
+    __slots__ = ("times", "cursor", "next")
+
+    def __init__(self, times):
+        self.times = times
+        self.cursor = 0
+        self.next = int(times[0]) if len(times) > 0 else None
+
+    def __len__(self):
+        return len(self.times) - self.cursor
+
+    def pop(self, t):
+        ### Consume the arrivals at tick t and return how many there were
+        n = 0
+        while self.next == t:
+            n += 1
+            self.cursor += 1
+            self.next = int(self.times[self.cursor]) if self.cursor < len(self.times) else None
+        return n
+
+
+def uniform_arrivals(setting):
+    ### packet_num distinct ticks per host, the same ticks gen_packets has always produced
+    random.seed(setting.seed)
+    return [
+        np.sort(np.array(random.sample(range(1, setting.total_time - setting.packet_time), setting.packet_num), dtype=np.int64))
+        for _ in range(setting.host_num)
+    ]
+
+
+def poisson_arrivals(setting, rng):
+    ### Poisson number of packets per tick with mean packet_num / span
+    low, high = 1, setting.total_time - setting.packet_time
+    packets = []
+    for _ in range(setting.host_num):
+        n = rng.poisson(setting.packet_num)
+        packets.append(np.sort(rng.integers(low, high, size=n)))
+    return packets
+
+
+def bernoulli_arrivals(setting, rng):
+    ### At most one packet per tick, with probability packet_num / span
+    low, high = 1, setting.total_time - setting.packet_time
+    span = high - low
+    packets = []
+    for _ in range(setting.host_num):
+        n = rng.binomial(span, setting.packet_num / span)
+        packets.append(np.sort(rng.choice(span, size=n, replace=False)) + low)
+    return packets
+
+
+def gen_arrivals(setting):
+    """
+    Arrival ticks of every host as a list of Arrivals.
+
+    The `random` module is seeded with setting.seed for every process so the
+    backoff draws that follow are reproducible; the poisson and bernoulli
+    processes draw their ticks from a NumPy generator with the same seed.
+    """
+    if setting.arrival == "uniform":
+        packets = uniform_arrivals(setting)
+    else:
+        random.seed(setting.seed)
+        rng = np.random.default_rng(setting.seed)
+        if setting.arrival == "poisson":
+            packets = poisson_arrivals(setting, rng)
+        elif setting.arrival == "bernoulli":
+            packets = bernoulli_arrivals(setting, rng)
+        else:
+            raise ValueError(f"unknown arrival process {setting.arrival!r}, expected one of {ARRIVAL_PROCESSES}")
+    return [Arrivals(p.astype(np.int64)) for p in packets]
@@ -0,0 +1,194 @@
+import copy
+
+import numpy as np
+
+from host import STANDBY, SEND, RESEND, STOP
+from sweep import confidence_interval
+
+
+class UniformStreams:
+    """
+    One stream of uniform random numbers per (replication, host).
+
+    The k-th draw of a host always reads the k-th number of its stream, so
+    two protocols run with the same streams use the same random numbers for
+    the same host and the same draw (common random numbers) even though they
+    draw at different ticks.
+    """
+
+    def __init__(self, seed, replications, host_num, block=64):
+        self.rng = np.random.default_rng(seed)
+        self.block = block
+        self.buffer = self.rng.random((replications, host_num, block))
+        self.cursor = np.zeros((replications, host_num), dtype=np.int64)
+
+    def take(self, mask):
+        ### Next number of every (replication, host) where mask is True
+        r, h = np.nonzero(mask)
+        values = self.buffer[r, h, self.cursor[r, h]]
+        self.cursor[r, h] += 1
+        full = self.cursor[r, h] == self.block
+        if full.any():
+            r, h = r[full], h[full]
+            self.buffer[r, h] = self.rng.random((len(r), self.block))
+            self.cursor[r, h] = 0
+        return values
+
+
+def arrival_schedule(setting, seeds):
+    ### Like vectorized.arrival_schedule with the hosts of replication k numbered k * host_num + i
+    times, owners = [], []
+    for k, seed in enumerate(seeds):
+        s = copy.copy(setting)
+        s.seed = seed
+        for i, a in enumerate(s.gen_arrivals()):
+            times.append(a.times)
+            owners.append(np.full(len(a.times), k * setting.host_num + i))
+    times, owners = np.concatenate(times), np.concatenate(owners)
+    order = np.argsort(times, kind="stable")
+    times, owners = times[order], owners[order]
+    ticks, starts = np.unique(times, return_index=True)
+    return ticks.tolist(), np.split(owners, starts[1:])
+
+
+def replicate(setting, policy, replications=10, seed=None):
+    """
+    Run `replications` independent replications of one policy in one pass.
+
+    Host state is kept in (replications, host_num) arrays and advanced one
+    tick for every replication at once. Replication k uses the arrivals of
+    setting with the seed setting.replication_seeds(replications)[k], and
+    the backoff and resend draws come from UniformStreams seeded with `seed`
+    (setting.seed by default). Calling replicate with the same setting and
+    seed for several policies therefore gives common random numbers across
+    the policies.
+
+    Returns a (replications, 3) array of (success, idle, collision) rates.
+    """
+    seeds = setting.replication_seeds(replications)
+    if seed is None:
+        seed = setting.seed
+    K, n = replications, setting.host_num
+    backoff_streams = UniformStreams([seed, 0], K, n)
+    resend_streams = UniformStreams([seed, 1], K, n)
+    arrival_ticks, arrival_hosts = arrival_schedule(setting, seeds)
+    next_arrival = 0
+
+    status = np.zeros((K, n), dtype=np.int8)
+    packet_num = np.zeros((K, n), dtype=np.int64)
+    remain_length = np.full((K, n), setting.total_time, dtype=np.int64)
+    wait_time = np.zeros((K, n), dtype=np.int64)
+    collision = np.zeros((K, n), dtype=bool)
+    sending = np.zeros((K, n), dtype=bool)
+    # collisions of the packet each host is trying to send, for policies with a growing window
+    attempts = np.zeros((K, n), dtype=np.int64)
+    success_num = np.zeros(K, dtype=np.int64)
+    total_idle_time = np.zeros(K, dtype=np.int64)
+
+    no_one = np.zeros((K, n), dtype=bool)
+    delay = setting.link_delay + 1
+    busy_ring = np.zeros((max(delay, 1), K, n), dtype=bool)
+
+    def backoff(mask):
+        wait_time[mask] = policy.backoff_from_uniform(setting, backoff_streams.take(mask), attempts[mask])
+
+    for t in range(setting.total_time):
+        ### Generate packets for each host
+        if next_arrival < len(arrival_ticks) and arrival_ticks[next_arrival] == t:
+            np.add.at(packet_num.reshape(-1), arrival_hosts[next_arrival], 1)
+            next_arrival += 1
+
+        ### Decide whether each host should send a packet
+        if policy.sensing and setting.link_delay >= 0 and t > delay:
+            busy = busy_ring[t % delay]
+            others_sending = (busy.sum(axis=1, keepdims=True) - busy) > 0
+        else:
+            others_sending = no_one
+
+        action_to_do = status.copy()
+        standby = status == STANDBY
+        waiting = standby & (wait_time > 0)
+        if policy.freeze_backoff:
+            wait_time[waiting & ~others_sending] -= 1
+        else:
+            wait_time[waiting] -= 1
+
+        if not policy.slotted or t % setting.packet_time == 0:
+            ready = standby & ~waiting & (packet_num > 0)
+            send = ready & ~others_sending
+            if not policy.one_persistent:
+                blocked = ready & others_sending
+                if blocked.any():
+                    backoff(blocked)
+            if policy.resend:
+                resend = status == RESEND
+                if resend.any():
+                    send[resend] = resend_streams.take(resend) < setting.p_resend
+            action_to_do[send] = SEND
+            remain_length[send] = setting.packet_time
+        if policy.collision_detection:
+            action_to_do[(status == SEND) & others_sending] = STOP
+
+        ### Perform the action decided in the previous step
+        stop = action_to_do == STOP
+        stopped = stop.any(axis=1)
+        if stopped.any():
+            collision[stop] = False
+            remain_length[stop] = 0
+            attempts[stop] += 1
+            backoff(stop)
+            action_to_do[stop] = STANDBY
+        status = action_to_do
+
+        ### Check for collisions and idle time
+        transmitting = status == SEND
+        sending_num = transmitting.sum(axis=1)
+        collision |= transmitting & (sending_num > 1)[:, None]
+        total_idle_time += (sending_num == 0) & ~stopped
+
+        ###  Update the host's status
+        remain_length[transmitting] -= 1
+        done = transmitting & (remain_length <= 0)
+        sending = transmitting & ~done
+        if done.any():
+            collided = done & collision
+            succeeded = done & ~collision
+            if collided.any():
+                attempts[collided] += 1
+                if policy.resend:
+                    status[collided] = RESEND
+                else:
+                    backoff(collided)
+                    status[collided] = STANDBY
+            status[succeeded] = STANDBY
+            packet_num[succeeded] -= 1
+            attempts[succeeded] = 0
+            success_num += succeeded.sum(axis=1)
+            collision[done] = False
+        if policy.sensing:
+            busy_ring[t % delay] = sending
+
+    success = success_num * setting.packet_time / setting.total_time
+    idle = total_idle_time / setting.total_time
+    return np.stack([success, idle, 1 - success - idle], axis=1)
+
+
+def summary(results):
+    ### Mean and 95% confidence interval half width of each rate of a replicate() result
+    return results.mean(axis=0), np.array([confidence_interval(list(column)) for column in results.T])
+
+
+def compare(setting, policies, replications=10, seed=None):
+    """
+    Run every policy of the dict `policies` with common random numbers.
+
+    Returns {name: (replications, 3) array}. Because every policy sees the
+    same arrivals and the same backoff streams, the paired differences from
+    difference() have a much smaller variance than independent runs.
+    """
+    return {name: replicate(setting, policy, replications, seed) for name, policy in policies.items()}
+
+
+def difference(a, b):
+    ### Mean and 95% confidence interval half width of the paired difference a - b of two replicate() results
+    return summary(a - b)
@@ -0,0 +1,87 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+
+from setting import Setting
+
+# fixed scenarios, all seeded so every run simulates the same packets
+SCENARIOS = {
+    "small": dict(host_num=3, total_time=100, packet_num=4, max_collision_wait_time=20, p_resend=0.3, packet_size=3, link_delay=1, seed=4),
+    "default": dict(seed=1),
+    "1M_16hosts": dict(host_num=16, total_time=1_000_000, packet_num=10_000, seed=1),
+    "10M_64hosts": dict(host_num=64, total_time=10_000_000, packet_num=25_000, seed=1),
+}
+ENGINES = ("protocols", "vectorized", "event_driven")
+PROTOCOLS = ("aloha", "slotted_aloha", "csma", "csma_cd", "csma_ca")
+
+
+def run(scenario, engine, protocol, queue):
+    ### Run one benchmark in a fresh process and report its timing and peak RSS
+    setting = Setting(**SCENARIOS[scenario])
+    arrivals = sum(len(a) for a in setting.gen_arrivals())
+    start = time.perf_counter()
+    result = getattr(importlib.import_module(engine), protocol)(setting)
+    seconds = time.perf_counter() - start
+    # events: packet arrivals plus finished transmissions
+    events = arrivals + round(result[0] * setting.total_time / setting.packet_time)
+    queue.put({
+        "seconds": seconds,
+        "ticks_per_sec": setting.total_time / seconds,
+        "events_per_sec": events / seconds,
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+        "result": result,
+    })
+
+
+def benchmark(scenarios=SCENARIOS, engines=ENGINES, protocols=PROTOCOLS, timeout=600):
+    """
+    Time every protocol function of every engine on every scenario.
+
+    Each run gets its own spawned process so the peak RSS belongs to that run
+    only; runs longer than `timeout` seconds are stopped and reported with
+    "timeout": true.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for scenario in scenarios:
+        for engine in engines:
+            for protocol in protocols:
+                queue = context.Queue()
+                process = context.Process(target=run, args=(scenario, engine, protocol, queue))
+                process.start()
+                process.join(timeout)
+                row = {"scenario": scenario, "engine": engine, "protocol": protocol, "ticks": SCENARIOS[scenario].get("total_time", Setting().total_time)}
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+                    row["timeout"] = True
+                else:
+                    row.update(queue.get())
+                results.append(row)
+                print(json.dumps(row))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MAC protocol simulators")
+    parser.add_argument("--scenario", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--engine", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--protocol", nargs="+", default=list(PROTOCOLS), choices=list(PROTOCOLS))
+    parser.add_argument("--timeout", type=float, default=600, help="seconds before a run is stopped")
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    results = benchmark(args.scenario, args.engine, args.protocol, args.timeout)
+    with open(args.output, "w") as f:
+        json.dump({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, f, indent=2)
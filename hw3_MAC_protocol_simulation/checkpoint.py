@@ -0,0 +1,85 @@
+import gzip
+import os
+import pickle
+import random
+
+import numpy as np
+
+# host fields stored in the snapshot, one int64 column each
+HOST_FIELDS = ("status", "action_to_do", "packet_num", "remain_length", "wait_time", "collision", "success_num", "collision_num")
+
+
+class Checkpoint:
+    """
+    Snapshot the state of protocols.simulate to `path` and resume from it.
+
+    Pass it as `checkpoint=` to a protocol function of protocols.py. The
+    snapshot is written every `every` ticks and at `until`, and holds the
+    host state, the arrival cursors, the `random` state, the policy and
+    channel state and the idle counter, gzip-pickled and replaced atomically.
+    The history and the monitor are not part of it; record a new
+    history.HistoryFile per segment if you need one. A monitor passed to a
+    resumed run starts its first window at the resume tick, and the packets
+    queued then count as arriving at that tick.
+
+    With resume=True and an existing file the run continues from the saved
+    tick instead of tick 0. With `until` set the run stops after tick
+    until - 1 and returns the rates so far, so one long run can be split into
+    time segments, each run by its own process:
+
+        csma_cd(setting, checkpoint=Checkpoint(path, until=50_000_000))
+        csma_cd(setting, checkpoint=Checkpoint(path, resume=True))
+    """
+
+    def __init__(self, path, every=None, resume=False, until=None):
+        self.path = path
+        self.every = every
+        self.resume = resume
+        self.until = until
+
+    def due(self, t):
+        ### Whether to snapshot at the end of tick t
+        return (self.every is not None and (t + 1) % self.every == 0) or t + 1 == self.until
+
+    def save(self, t, setting, hosts, arrivals, policy, channel, total_idle_time):
+        ### Snapshot the state at the end of tick t
+        state = {
+            "setting": {k: v for k, v in vars(setting).items() if k != "profile"},
+            "t": t + 1,
+            "hosts": np.array([[int(getattr(h, k)) for k in HOST_FIELDS] for h in hosts], dtype=np.int64),
+            "cursors": np.array([a.cursor for a in arrivals], dtype=np.int64),
+            "random": random.getstate(),
+            # not the methods a Profiler wraps on the instance
+            "policy": {k: v for k, v in vars(policy).items() if not callable(v)},
+            "channel": (channel.sending_num, channel.sender),
+            "total_idle_time": total_idle_time,
+        }
+        tmp = f"{self.path}.tmp"
+        with gzip.open(tmp, "wb", compresslevel=1) as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def restore(self, setting, hosts, arrivals, policy, channel):
+        ### Load the snapshot into the given state, return (first tick to run, total_idle_time)
+        if not (self.resume and os.path.exists(self.path)):
+            return 0, 0
+        state = load_checkpoint(self.path)
+        if state["setting"] != {k: v for k, v in vars(setting).items() if k != "profile"}:
+            raise ValueError(f"{self.path} was saved with a different setting")
+        for h, row in zip(hosts, state["hosts"].tolist()):
+            for k, v in zip(HOST_FIELDS, row):
+                setattr(h, k, v)
+            h.collision = bool(h.collision)
+        for a, cursor in zip(arrivals, state["cursors"].tolist()):
+            a.cursor = cursor
+            a.next = int(a.times[cursor]) if cursor < len(a.times) else None
+        random.setstate(state["random"])
+        vars(policy).update(state["policy"])
+        channel.sending_num, channel.sender = state["channel"]
+        return state["t"], state["total_idle_time"]
+
+
+def load_checkpoint(path):
+    ### Read a snapshot written by Checkpoint.save
+    with gzip.open(path, "rb") as f:
+        return pickle.load(f)
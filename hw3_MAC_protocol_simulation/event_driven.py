@@ -0,0 +1,212 @@
+import heapq
+from bisect import bisect_right
+
+from history import History
+from host import STANDBY, SEND, RESEND
+from policies import Aloha, SlottedAloha, Csma, CsmaCd, CsmaCa
+from protocols import init_hosts, perform_action, check_collisions_and_idle_time, print_history, calculate_metrics
+
+
+class ChannelRecord:
+    """
+    Busy state of the channel at the visited ticks.
+
+    Between two visited ticks no transmission starts or ends, so the set of
+    hosts writing "<" or "-" is constant and one (count, sole sender) pair per
+    visited tick describes every tick up to the next one. Answers the same
+    question as protocols.Channel for any tick, not only the last ones.
+    """
+
+    def __init__(self, setting):
+        self.link_delay = setting.link_delay
+        self.ticks = [-1]
+        self.states = [(0, None)]
+
+    def record(self, t, count, sole):
+        ### Return True when the state differs from the previous visited tick
+        state = (min(count, 2), sole if count == 1 else None)
+        if state == self.states[-1]:
+            return False
+        self.ticks.append(t)
+        self.states.append(state)
+        return True
+
+    def others_sending(self, h, t):
+        ### Whether a host other than h was sending link_delay + 1 ticks before t
+        if self.link_delay < 0 or t <= self.link_delay + 1:
+            return False
+        count, sole = self.states[bisect_right(self.ticks, t - (self.link_delay + 1)) - 1]
+        return count > 1 or (count == 1 and sole != h.id)
+
+    def forget_before(self, s):
+        ### Drop records that no future lookup at tick >= s can reach
+        i = bisect_right(self.ticks, s) - 1
+        if i > 0:
+            del self.ticks[:i]
+            del self.states[:i]
+
+
+def simulate(setting, policy, show_history=False, record=None, monitor=None):
+    """
+    Next-event time advance version of protocols.simulate.
+
+    Only ticks with an event are visited: packet arrivals, backoff expiries,
+    transmission ends, slot boundaries and the ticks where the delayed carrier
+    sense changes. Every other tick is skipped in O(1), so at low load the cost
+    scales with the number of packets instead of setting.total_time. The
+    visited ticks run the same per-tick logic and draw random numbers in the
+    same order, so the result equals protocols.py for the same seed.
+    """
+    hosts = init_hosts(setting)
+    arrivals = setting.gen_arrivals() # Generate packets for each host
+    # heap of (next arrival tick, host id), one entry per host with packets left
+    arrival_heap = [(a.next, i) for i, a in enumerate(arrivals) if a.next is not None]
+    heapq.heapify(arrival_heap)
+    if show_history and record is None:
+        record = History(setting.host_num)
+
+    policy.reset(setting)
+    delay = setting.link_delay + 1
+    channel = ChannelRecord(setting)
+
+    events = [0]
+    if policy.sensing:
+        events.append(delay + 1)
+    # tick of the backoff expiry last scheduled for each host
+    wake = [None] * setting.host_num
+    total_idle_time = 0
+    elapsed = setting.total_time
+    last_t = -1
+    transmitting = False
+    while True:
+        ### Jump to the next event
+        t = setting.total_time
+        if arrival_heap:
+            t = min(t, arrival_heap[0][0])
+        while events and events[0] <= last_t:
+            heapq.heappop(events)
+        if events:
+            t = min(t, events[0])
+
+        skipped = t - last_t - 1
+        if not transmitting:
+            total_idle_time += skipped
+        if record is not None and skipped > 0:
+            record.record(["-" if h.status == SEND else "." for h in hosts], skipped)
+        if t >= setting.total_time:
+            break
+        for h in hosts:
+            if h.status == SEND:
+                h.remain_length -= skipped
+            elif h.status == STANDBY and h.wait_time > 0:
+                # the carrier sense does not change over the skipped ticks
+                if not (policy.freeze_backoff and channel.others_sending(h, last_t + 1)):
+                    h.wait_time = max(0, h.wait_time - skipped)
+        last_t = t
+
+        history = ["." for i in range(setting.host_num)]
+
+        ### Generate packets for each host
+        while arrival_heap and arrival_heap[0][0] == t:
+            _, i = heapq.heappop(arrival_heap)
+            arrived = arrivals[i].pop(t)
+            hosts[i].packet_num += arrived
+            if monitor is not None:
+                monitor.arrival(i, t, arrived)
+            if arrivals[i].next is not None:
+                heapq.heappush(arrival_heap, (arrivals[i].next, i))
+
+        ### Decide whether each host should send a packet
+        for h in hosts:
+            h.action_to_do = policy.decide(setting, h, t, channel)
+
+        ### Perform the action decided in the previous step
+        perform_action(setting, hosts, history, policy)
+
+        ### Check for collisions and idle time
+        total_idle_time = check_collisions_and_idle_time(hosts, total_idle_time, history)
+
+        ###  Update the host's status and history
+        busy_count = 0
+        busy_host = None
+        transmitting = False
+        for h in hosts:
+            if h.status == SEND:
+                if h.remain_length == setting.packet_time:
+                    history[h.id] = "<"
+                    heapq.heappush(events, t + setting.packet_time - 1)
+                else:
+                    history[h.id] = "-"
+                h.remain_length -= 1
+                if h.remain_length <= 0:
+                    if h.collision:
+                        h.collision_num += 1
+                        history[h.id] = "|"
+                        policy.on_collision(setting, h.id)
+                        if policy.resend:
+                            h.status = RESEND
+                        else:
+                            h.wait_time = policy.backoff(setting, h.id)
+                            h.status = STANDBY
+                    else:
+                        h.status = STANDBY
+                        h.success_num += 1
+                        h.packet_num -= 1
+                        history[h.id] = ">"
+                        policy.on_success(setting, h.id)
+                        if monitor is not None:
+                            monitor.success(h.id, t)
+                    h.collision = False
+                else:
+                    busy_count += 1
+                    busy_host = h.id
+                    transmitting = True
+        if record is not None:
+            record.record(history)
+        if monitor is not None and monitor.tick(t, total_idle_time):
+            elapsed = t + 1
+            break
+
+        ### Schedule the next ticks at which something can happen
+        if monitor is not None:
+            heapq.heappush(events, monitor.window_end())
+        if policy.sensing:
+            if channel.record(t, busy_count, busy_host):
+                heapq.heappush(events, t + delay)
+            channel.forget_before(t + 1 - delay)
+        next_slot = (t // setting.packet_time + 1) * setting.packet_time
+        for h in hosts:
+            if h.status == RESEND:
+                heapq.heappush(events, next_slot)
+            elif h.status == STANDBY and h.packet_num > 0:
+                if h.wait_time > 0:
+                    if wake[h.id] != t + h.wait_time + 1:
+                        wake[h.id] = t + h.wait_time + 1
+                        heapq.heappush(events, wake[h.id])
+                elif policy.slotted:
+                    heapq.heappush(events, next_slot)
+                elif not (policy.sensing and policy.one_persistent and channel.others_sending(h, t + 1)):
+                    heapq.heappush(events, t + 1)
+
+    print_history(setting, record, show_history)
+    return calculate_metrics(setting, hosts, total_idle_time, elapsed)
+
+
+def aloha(setting, show_history=False, record=None, monitor=None):
+    return simulate(setting, Aloha(), show_history, record, monitor)
+
+
+def slotted_aloha(setting, show_history=False, record=None, monitor=None):
+    return simulate(setting, SlottedAloha(), show_history, record, monitor)
+
+
+def csma(setting, one_persistent=False, show_history=False, record=None, monitor=None):
+    return simulate(setting, Csma(one_persistent), show_history, record, monitor)
+
+
+def csma_cd(setting, one_persistent=False, show_history=False, record=None, monitor=None):
+    return simulate(setting, CsmaCd(one_persistent), show_history, record, monitor)
+
+
+def csma_ca(setting, show_history=False, record=None, monitor=None):
+    return simulate(setting, CsmaCa(), show_history, record, monitor)
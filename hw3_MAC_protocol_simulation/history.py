@@ -0,0 +1,82 @@
+import struct
+
+HEADER = struct.Struct("!4sI")
+MAGIC = b"MACH"
+
+
+class History:
+    """
+    Action history of every host, one byte per host per tick.
+
+    Ticks are stored one after another in a single bytearray, so recording a
+    tick is one extend; the history of host i is every host_num-th byte.
+    Characters are the ones protocols.py writes: "." idle, "<" start of a
+    transmission, "-" sending, ">" success, "|" collision.
+    """
+
+    def __init__(self, host_num):
+        self.host_num = host_num
+        self.data = bytearray()
+
+    def __len__(self):
+        return len(self.data) // self.host_num if self.host_num else 0
+
+    def record(self, history, ticks=1):
+        ### Append `ticks` ticks in which host i wrote history[i]
+        self.data += "".join(history).encode() * ticks
+
+    def host_history(self, host_id):
+        return self.data[host_id::self.host_num].decode()
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.host_num))
+            f.write(self.data)
+
+    def close(self):
+        pass
+
+
+class HistoryFile(History):
+    """
+    History streamed to a file instead of kept in memory, for long runs.
+
+    The file has the layout History.save writes and can be read back with
+    load_history.
+    """
+
+    def __init__(self, host_num, path):
+        super().__init__(host_num)
+        self.path = path
+        self.ticks = 0
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, host_num))
+
+    def __len__(self):
+        return self.ticks
+
+    def record(self, history, ticks=1):
+        self.file.write("".join(history).encode() * ticks)
+        self.ticks += ticks
+
+    def host_history(self, host_id):
+        self.file.flush()
+        return load_history(self.path).host_history(host_id)
+
+    def save(self, path):
+        self.file.flush()
+        load_history(self.path).save(path)
+
+    def close(self):
+        self.file.close()
+
+
+def load_history(path):
+    ### Read a history written by History.save or HistoryFile
+    with open(path, "rb") as f:
+        magic, host_num = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a history file")
+        history = History(host_num)
+        history.data = bytearray(f.read())
+    return history
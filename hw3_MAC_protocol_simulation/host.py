@@ -0,0 +1,37 @@
+# host status and action codes
+STANDBY = 0
+SEND = 1
+RESEND = 2
+STOP = 3 # action only: stop sending after hearing another host
+
+
+class Host:
+    """
+    State of one host.
+
+    A __slots__ class: attribute access instead of string-keyed dict lookups
+    and no per-instance __dict__, which matters with thousands of hosts. The
+    old dict interface, h["status"], still works through __getitem__.
+    """
+
+    __slots__ = ("id", "status", "action_to_do", "packet_num", "remain_length", "wait_time", "collision", "success_num", "collision_num")
+
+    def __init__(self, id, remain_length):
+        self.id = id
+        self.status = STANDBY       # STANDBY, SEND or RESEND
+        self.action_to_do = STANDBY # STANDBY, SEND, RESEND or STOP
+        self.packet_num = 0
+        self.remain_length = remain_length  # remain time to sending
+        self.wait_time = 0          # time wait to send
+        self.collision = False
+        self.success_num = 0
+        self.collision_num = 0
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return "Host(" + ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__) + ")"
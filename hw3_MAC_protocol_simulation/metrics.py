@@ -0,0 +1,100 @@
+from collections import deque
+
+
+class WindowMetrics:
+    """
+    Streaming metrics of a running simulation, reported every `window` ticks.
+
+    Pass it as `monitor=` to a protocol function. After each window a dict with
+    the success/idle/collision rates of the window, the throughput of each host
+    and the mean queueing delay (arrival tick to ">" tick) of the packets
+    delivered in the window is appended to `windows` and passed to `callback`.
+
+    With `tolerance` set, the run stops early once `patience` consecutive
+    windows have every rate within `tolerance` of the previous window.
+    Successes are counted in the window of their ">" tick, like
+    calculate_metrics counts them over the whole run.
+    """
+
+    def __init__(self, setting, window=1000, callback=None, tolerance=None, patience=3):
+        self.setting = setting
+        self.window = window
+        self.callback = callback
+        self.tolerance = tolerance
+        self.patience = patience
+        self.windows = []
+        self.stable = 0
+
+        self.queues = [deque() for _ in range(setting.host_num)]
+        self.success_num = [0] * setting.host_num
+        self.total_delay = [0] * setting.host_num
+        self.window_success = [0] * setting.host_num
+        self.window_delay = [0] * setting.host_num
+        self.window_start = 0
+        self.idle_at_window_start = 0
+
+    def resume(self, start, total_idle_time, hosts):
+        ### Start at tick `start` of a run resumed from a checkpoint; packets already queued count as arriving then
+        self.window_start = start
+        self.idle_at_window_start = total_idle_time
+        for h in hosts:
+            self.queues[h.id] = deque([start] * h.packet_num)
+
+    def arrival(self, host_id, t, n=1):
+        self.queues[host_id].extend([t] * n)
+
+    def success(self, host_id, t):
+        delay = t - self.queues[host_id].popleft()
+        self.success_num[host_id] += 1
+        self.total_delay[host_id] += delay
+        self.window_success[host_id] += 1
+        self.window_delay[host_id] += delay
+
+    def window_end(self):
+        ### Last tick of the current window, event-driven engines visit it
+        return self.window_start + self.window - 1
+
+    def tick(self, t, total_idle_time):
+        ### Called at the end of tick t, returns True when the run should stop
+        if t + 1 - self.window_start < self.window:
+            return False
+        self.report(t, total_idle_time)
+        return self.tolerance is not None and self.stable >= self.patience
+
+    def report(self, t, total_idle_time):
+        length = t + 1 - self.window_start
+        success_num = sum(self.window_success)
+        success_rate = success_num * self.setting.packet_time / length
+        idle_rate = (total_idle_time - self.idle_at_window_start) / length
+        result = {
+            "start": self.window_start,
+            "end": t + 1,
+            "success_rate": success_rate,
+            "idle_rate": idle_rate,
+            "collision_rate": 1 - success_rate - idle_rate,
+            "throughput": [n * self.setting.packet_time / length for n in self.window_success],
+            "mean_delay": sum(self.window_delay) / success_num if success_num else None,
+        }
+
+        if self.windows and self.tolerance is not None:
+            last = self.windows[-1]
+            if all(abs(result[k] - last[k]) <= self.tolerance for k in ("success_rate", "idle_rate", "collision_rate")):
+                self.stable += 1
+            else:
+                self.stable = 0
+        self.windows.append(result)
+        if self.callback is not None:
+            self.callback(result)
+
+        self.window_start = t + 1
+        self.idle_at_window_start = total_idle_time
+        self.window_success = [0] * self.setting.host_num
+        self.window_delay = [0] * self.setting.host_num
+
+    def host_throughput(self, elapsed):
+        ### Fraction of the elapsed ticks each host spent on successful packets
+        return [n * self.setting.packet_time / elapsed for n in self.success_num]
+
+    def mean_delay(self):
+        ### Mean queueing delay of each host, None for hosts without a success
+        return [d / n if n else None for d, n in zip(self.total_delay, self.success_num)]
@@ -0,0 +1,136 @@
+import random
+
+from host import STANDBY, SEND, RESEND, STOP
+
+
+class Policy:
+    """
+    Decide/backoff rules of one MAC protocol.
+
+    The simulation kernels (protocols.simulate, vectorized.simulate and
+    event_driven.simulate) do the arrivals, collisions, status updates and
+    metrics; a policy only says when a host may start sending and how long
+    it waits after a collision.
+
+    Attributes:
+        slotted: new packets and resends only start at slot boundaries (t % packet_time == 0)
+        sensing: listen to the channel link_delay + 1 ticks back before sending
+        one_persistent: keep sensing a busy channel instead of backing off
+        collision_detection: stop sending when another host is heard
+        freeze_backoff: wait_time only counts down while the channel is heard idle
+        resend: after a collision resend with probability p_resend at each slot
+            boundary (status RESEND) instead of waiting a random backoff
+    """
+
+    name = None
+    slotted = False
+    sensing = False
+    one_persistent = False
+    collision_detection = False
+    freeze_backoff = False
+    resend = False
+
+    def reset(self, setting):
+        ### Called once before a run
+        pass
+
+    def backoff(self, setting, host_id):
+        ### Random wait_time after a collision or a busy channel
+        return random.randint(0, setting.max_collision_wait_time)
+
+    def backoff_from_uniform(self, setting, u, attempts):
+        ### Backoff of many hosts at once from uniforms u in [0, 1), for batch.replicate
+        return (u * (setting.max_collision_wait_time + 1)).astype(int)
+
+    def on_collision(self, setting, host_id):
+        pass
+
+    def on_success(self, setting, host_id):
+        pass
+
+    def decide(self, setting, h, t, channel):
+        ### Return the action of host h in tick t, drawing a backoff if needed
+        slot_start = not self.slotted or t % setting.packet_time == 0
+        if h.status == STANDBY:
+            if h.wait_time > 0:
+                if not (self.freeze_backoff and channel.others_sending(h, t)):
+                    h.wait_time -= 1
+
+            elif h.packet_num > 0 and slot_start:
+                if self.sensing and channel.others_sending(h, t):
+                    if not self.one_persistent:
+                        h.wait_time = self.backoff(setting, h.id)
+                else:
+                    h.remain_length = setting.packet_time
+                    return SEND
+
+        elif h.status == RESEND and slot_start:
+            r = random.random()
+            if r < setting.p_resend:
+                h.remain_length = setting.packet_time
+                return SEND
+
+        elif h.status == SEND and self.collision_detection:
+            if channel.others_sending(h, t):
+                return STOP
+
+        return h.status
+
+
+class Aloha(Policy):
+    name = "aloha"
+
+
+class SlottedAloha(Policy):
+    name = "slotted_aloha"
+    slotted = True
+    resend = True
+
+
+class Csma(Policy):
+    name = "csma"
+    sensing = True
+
+    def __init__(self, one_persistent=False):
+        self.one_persistent = bool(one_persistent)
+
+
+class CsmaCd(Csma):
+    name = "csma_cd"
+    collision_detection = True
+
+
+class CsmaCa(Policy):
+    """
+    CSMA/CA with binary exponential backoff.
+
+    A host that hears a busy channel, or whose packet collided, waits a random
+    number of slots (link_delay + 1 ticks) from a window that starts at
+    CW_MIN slots and doubles after every collision of the same packet, up to
+    max_collision_wait_time ticks. The wait is frozen while the channel is
+    busy and the window is reset after a success.
+    """
+
+    name = "csma_ca"
+    sensing = True
+    freeze_backoff = True
+    CW_MIN = 2
+
+    def reset(self, setting):
+        self.attempts = [0] * setting.host_num
+
+    def backoff(self, setting, host_id):
+        slot = setting.link_delay + 1
+        window = min(self.CW_MIN << min(self.attempts[host_id], 16), setting.max_collision_wait_time // slot + 1)
+        return random.randint(0, window - 1) * slot
+
+    def backoff_from_uniform(self, setting, u, attempts):
+        slot = setting.link_delay + 1
+        window = (self.CW_MIN << attempts.clip(max=16)).clip(max=setting.max_collision_wait_time // slot + 1)
+        return (u * window).astype(int) * slot
+
+    def on_collision(self, setting, host_id):
+        self.attempts[host_id] += 1
+
+    def on_success(self, setting, host_id):
+        self.attempts[host_id] = 0
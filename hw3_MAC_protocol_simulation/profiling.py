@@ -0,0 +1,65 @@
+import time
+
+
+class Profiler:
+    """
+    Wall time and call counts of each phase of protocols.simulate.
+
+    Enabled with Setting(profile=True), which prints the breakdown after the
+    run, or Setting(profile=Profiler()) to add several runs into one profiler
+    and print it yourself with report(). With profile=False the kernel only
+    pays one `is not None` check per phase per tick.
+
+    The kernel calls lap(name) at the end of each phase, which charges the
+    time since the previous lap to that phase. Methods wrapped with timed()
+    are also timed on their own, as sub-phases of the phase calling them;
+    name them "phase.sub" so they are left out of the total. untime() puts
+    the original methods back.
+    """
+
+    def __init__(self):
+        self.time = {}
+        self.calls = {}
+        self.last = time.perf_counter()
+        self.wrapped = []  # (obj, method, instance attribute it replaced or None)
+
+    def start(self):
+        ### Start the clock of the first phase
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.time[name] = self.time.get(name, 0.0) + now - self.last
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.last = now
+
+    def timed(self, obj, method, name):
+        ### Time every call of obj.method under `name`
+        function = getattr(obj, method)
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.time[name] = self.time.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return result
+
+        self.wrapped.append((obj, method, vars(obj).get(method)))
+        setattr(obj, method, wrapper)
+
+    def untime(self):
+        ### Undo every timed(), newest first
+        while self.wrapped:
+            obj, method, original = self.wrapped.pop()
+            if original is None:
+                delattr(obj, method)
+            else:
+                setattr(obj, method, original)
+
+    def report(self):
+        ### Print the phases from the slowest to the fastest
+        total = sum(t for name, t in self.time.items() if "." not in name) or 1.0
+        print(f"{'phase':<32}{'seconds':>10}{'share':>8}{'calls':>12}{'us/call':>10}")
+        for name, t in sorted(self.time.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            print(f"{name:<32}{t:>10.4f}{t / total:>8.1%}{calls:>12}{t / calls * 1e6:>10.2f}")
@@ -1,376 +1,224 @@
 import random
 
+from history import History
+from host import Host, STANDBY, SEND, RESEND, STOP
+from policies import Aloha, SlottedAloha, Csma, CsmaCd, CsmaCa
+from profiling import Profiler
+
 def init_hosts(setting):
-    hosts = [
-        {
-            "id": i,
-            "status": 0,         # 0: standby, 1: send, 2: resend
-            "action_to_do": 0,   # 0: standby, 1: send, 2: resend, 3: stop sending
-            "packet_num": 0,   
-            "remain_length": setting.total_time,  # remain time to sending
-            "wait_time": 0,      # time wait to send
-            "collision": False,
-            "success_num": 0,
-            "collision_num": 0,
-            "history": "",       # record history of host's actions
-        }
-        for i in range(setting.host_num)
-    ]
-    return hosts
+    return [Host(i, setting.total_time) for i in range(setting.host_num)]
 
-def perform_action(setting, hosts, history):
+def perform_action(setting, hosts, history, policy=None):
     ### Perform the action decided in the previous step
     for h in hosts:
-        if h["action_to_do"] == 3:  # stop sending
-            h["collision"] = False
-            h["remain_length"] = 0
-            h["collision_num"] += 1
-            h["wait_time"] = random.randint(0, setting.max_collision_wait_time)
-            history[h["id"]] = "|"
-            h["status"] = 0
+        if h.action_to_do == STOP:
+            h.collision = False
+            h.remain_length = 0
+            h.collision_num += 1
+            if policy is None:
+                h.wait_time = random.randint(0, setting.max_collision_wait_time)
+            else:
+                policy.on_collision(setting, h.id)
+                h.wait_time = policy.backoff(setting, h.id)
+            history[h.id] = "|"
+            h.status = STANDBY
         else:
-            h["status"] = h["action_to_do"]
+            h.status = h.action_to_do
 
 def check_collisions_and_idle_time(hosts, total_idle_time, history):
     ### Check for collisions and idle time
     sending_list = []
     is_idle_time = True
     for h in hosts:
-        if h["status"] == 1:
+        if h.status == SEND:
             sending_list.append(h)
             is_idle_time = False
-        if history[h["id"]] != ".":
+        if history[h.id] != ".":
             is_idle_time = False
             
     if len(sending_list) > 1:
         for h in sending_list:
-            h["collision"] = True
+            h.collision = True
     if is_idle_time:
         total_idle_time += 1
     
     return total_idle_time
 
-def print_history(setting, hosts, show_history=False):
-    ### Print the history of each host
+class Channel:
+    """
+    Carrier sense over the last link_delay + 1 ticks.
+
+    Keeps, for each tick in a ring buffer, how many hosts were sending ("<" or
+    "-") and which one when there was only one, so a host can check whether
+    any other host was sending link_delay + 1 ticks ago in O(1).
+    """
+
+    def __init__(self, setting):
+        self.link_delay = setting.link_delay
+        self.size = max(setting.link_delay + 1, 1)
+        self.sending_num = [0] * self.size
+        self.sender = [None] * self.size
+
+    def record(self, t, history):
+        ### Record the hosts sending in tick t, called after the history of tick t is decided
+        sending = [i for i, c in enumerate(history) if c == "<" or c == "-"]
+        self.sending_num[t % self.size] = len(sending)
+        self.sender[t % self.size] = sending[0] if len(sending) == 1 else None
+
+    def others_sending(self, h, t):
+        ### Whether a host other than h was sending link_delay + 1 ticks before t
+        if self.link_delay < 0 or t <= self.link_delay + 1:
+            return False
+        i = (t - (self.link_delay + 1)) % self.size
+        return self.sending_num[i] > 1 or (self.sending_num[i] == 1 and self.sender[i] != h.id)
+
+def print_history(setting, record, show_history=False):
+    ### Print the history of each host from a history.History
     if show_history:
-        packets_times = setting.gen_packets()
-        for h in hosts:
+        arrivals = setting.gen_arrivals()
+        for i in range(setting.host_num):
             s = ""
-            for t in range(setting.total_time):
-                if len(packets_times[h["id"]]) > 0 and packets_times[h["id"]][0] == t:
+            for t in range(len(record)):
+                if arrivals[i].pop(t) > 0:
                     s += "V"
-                    packets_times[h["id"]].pop(0)
                 else:
                     s += " "
             print(f"    {s}")
-            print(f"h{h['id']}: {h['history']}")
+            print(f"h{i}: {record.host_history(i)}")
 
-def calculate_metrics(setting, hosts, total_idle_time):
-    ### Calculate the success rate, idle rate, and collision rate      
+def calculate_metrics(setting, hosts, total_idle_time, elapsed=None):
+    ### Calculate the success rate, idle rate, and collision rate over the elapsed ticks
+    if elapsed is None:
+        elapsed = setting.total_time
     total_success_num = 0
     for h in hosts:
-        total_success_num += h["success_num"]
+        total_success_num += h.success_num
     total_success_time = total_success_num * setting.packet_time
-    total_collision_time = setting.total_time - total_success_time - total_idle_time
+    total_collision_time = elapsed - total_success_time - total_idle_time
     return (
-        total_success_time / setting.total_time,
-        total_idle_time / setting.total_time,
-        total_collision_time / setting.total_time,
+        total_success_time / elapsed,
+        total_idle_time / elapsed,
+        total_collision_time / elapsed,
     )
 
 
-def aloha(setting, show_history=False):
-    
+def simulate(setting, policy, show_history=False, record=None, monitor=None, checkpoint=None):
+    ### Run one MAC protocol, given as a policies.Policy, and return (success, idle, collision) rates
     hosts = init_hosts(setting)
-    packets_times = setting.gen_packets() # Generate packets for each host
-
+    arrivals = setting.gen_arrivals() # Generate packets for each host
+    if show_history and record is None:
+        record = History(setting.host_num)
+
+    policy.reset(setting)
+    channel = Channel(setting)
+    profiler = None
+    if setting.profile:
+        profiler = setting.profile if isinstance(setting.profile, Profiler) else Profiler()
+        profiler.timed(channel, "others_sending", "decide.carrier_sense")
+        profiler.timed(policy, "backoff", "decide.backoff")
     total_idle_time = 0
-    for t in range(setting.total_time):
+    elapsed = setting.total_time
+    start = 0
+    if checkpoint is not None:
+        start, total_idle_time = checkpoint.restore(setting, hosts, arrivals, policy, channel)
+        if monitor is not None and start:
+            monitor.resume(start, total_idle_time, hosts)
+    if profiler is not None:
+        profiler.start()
+    for t in range(start, setting.total_time):
         history = ["." for i in range(setting.host_num)]
         
         ### Generate packets for each host
         for h in hosts:
-            if len(packets_times[h["id"]]) > 0 and packets_times[h["id"]][0] == t:
-                packets_times[h["id"]].pop(0)
-                h["packet_num"] += 1
+            if arrivals[h.id].next == t:
+                arrived = arrivals[h.id].pop(t)
+                h.packet_num += arrived
+                if monitor is not None:
+                    monitor.arrival(h.id, t, arrived)
+        if profiler is not None:
+            profiler.lap("arrivals")
 
         ### Decide whether each host should send a packet
         for h in hosts:
-            h["action_to_do"] = h["status"]
-            
-            if h["status"] == 0:
-                if h["wait_time"] > 0:
-                    h["wait_time"] -= 1
-
-                elif h["packet_num"] > 0:
-                        # TODO:  change "xxx" to the correct protocol name
-                    h["action_to_do"] = 1
-                    h["remain_length"] = setting.packet_time
-            
+            h.action_to_do = policy.decide(setting, h, t, channel)
+        if profiler is not None:
+            profiler.lap("decide")
         
         ### Perform the action decided in the previous step
-        perform_action(setting, hosts, history)
+        perform_action(setting, hosts, history, policy)
+        if profiler is not None:
+            profiler.lap("perform_action")
 
         ### Check for collisions and idle time
         total_idle_time = check_collisions_and_idle_time(hosts, total_idle_time, history)
+        if profiler is not None:
+            profiler.lap("check_collisions_and_idle_time")
 
         ###  Update the host's status and history
         for h in hosts:
-            if h["status"] == 1:
-                if len(h["history"]) == 0 or (h["history"][-1] != "<" and h["history"][-1] != "-"):
-                    history[h["id"]] = "<"
+            if h.status == SEND:
+                if h.remain_length == setting.packet_time:
+                    history[h.id] = "<"
                 else:
-                    history[h["id"]] = "-"
-                h["remain_length"] -= 1
-                if h["remain_length"] <= 0:
-                    if h["collision"]:
-                        h["wait_time"] = random.randint(0, setting.max_collision_wait_time)
-                        h["status"] = 0 # standby
-                        h["collision_num"] += 1
-                        history[h["id"]] = "|"
+                    history[h.id] = "-"
+                h.remain_length -= 1
+                if h.remain_length <= 0:
+                    if h.collision:
+                        h.collision_num += 1
+                        history[h.id] = "|"
+                        policy.on_collision(setting, h.id)
+                        if policy.resend:
+                            h.status = RESEND
+                        else:
+                            h.wait_time = policy.backoff(setting, h.id)
+                            h.status = STANDBY
                     else:
-                        h["status"] = 0
-                        h["success_num"] += 1
-                        h["packet_num"] -= 1
-                        history[h["id"]] = ">"
-                    h["collision"] = False
-            h["history"] += history[h["id"]]
-    
-    
-    print_history(setting, hosts, show_history)
-    return calculate_metrics(setting, hosts, total_idle_time)
-    
-    
-
-def slotted_aloha(setting, show_history=False):
-    hosts = init_hosts(setting)
-    packets_times = setting.gen_packets() # Generate packets for each host
-
-    total_idle_time = 0
-    for t in range(setting.total_time):
-        history = ["." for i in range(setting.host_num)]
-        
-        ### Generate packets for each host
-        for h in hosts:
-            if len(packets_times[h["id"]]) > 0 and packets_times[h["id"]][0] == t:
-                packets_times[h["id"]].pop(0)
-                h["packet_num"] += 1
-
-        ### Decide whether each host should send a packet
-        for h in hosts:
-            h["action_to_do"] = h["status"]
-            
-            if h["status"] == 0:
-                if h["wait_time"] > 0:
-                    h["wait_time"] -= 1
-
-                elif h["packet_num"] > 0:    
-                    if t % setting.packet_time == 0:  # TODO:  change "xxx" to the correct protocol name
-                        h["action_to_do"] = 1       
-                        h["remain_length"] = setting.packet_time
-                    
-            
-            elif h["status"] == 2 and t % setting.packet_time == 0: # TODO:  change "xxx" to the correct protocol name
-                r = random.random()
-                if r < setting.p_resend:
-                    h["action_to_do"] = 1
-                    h["remain_length"] = setting.packet_time
-        
-        ### Perform the action decided in the previous step
-        perform_action(setting, hosts, history)
-
-        ### Check for collisions and idle time
-        total_idle_time = check_collisions_and_idle_time(hosts, total_idle_time, history)
-
-        ###  Update the host's status and history
-        for h in hosts:
-            if h["status"] == 1:
-                if len(h["history"]) == 0 or (h["history"][-1] != "<" and h["history"][-1] != "-"):
-                    history[h["id"]] = "<"
-                else:
-                    history[h["id"]] = "-"
-                h["remain_length"] -= 1
-                if h["remain_length"] <= 0:
-                    if h["collision"]:
-                        h["status"] = 2 # resend 
-                        h["collision_num"] += 1
-                        history[h["id"]] = "|"
-                    else:
-                        h["status"] = 0
-                        h["success_num"] += 1
-                        h["packet_num"] -= 1
-                        history[h["id"]] = ">"
-                    h["collision"] = False
-            h["history"] += history[h["id"]]
-    
-    
-    print_history(setting, hosts, show_history)
-    return calculate_metrics(setting, hosts, total_idle_time)
-    
-def csma(setting, one_persistent=False, show_history=False):
-    hosts = init_hosts(setting)
-    packets_times = setting.gen_packets() # Generate packets for each host
-
-    total_idle_time = 0
-    for t in range(setting.total_time):
-        history = ["." for i in range(setting.host_num)]
-        
-        ### Generate packets for each host
-        for h in hosts:
-            if len(packets_times[h["id"]]) > 0 and packets_times[h["id"]][0] == t:
-                packets_times[h["id"]].pop(0)
-                h["packet_num"] += 1
-
-        ### Decide whether each host should send a packet
-        for h in hosts:
-            h["action_to_do"] = h["status"]
-            
-            if h["status"] == 0:
-                if h["wait_time"] > 0:
-                    h["wait_time"] -= 1
-
-                elif h["packet_num"] > 0:
-                    others_sending = False
-                    for others in hosts:
-                        if others["id"] == h["id"]:
-                            continue
-                        if (
-                            setting.link_delay >= 0
-                            and t > (setting.link_delay + 1)
-                            and (
-                                others["history"][t - (setting.link_delay + 1)] == "-"
-                                or others["history"][t - (setting.link_delay + 1)] == "<"
-                            )
-                        ):
-                            others_sending = True
-                    
-                    if not others_sending:
-                        h["action_to_do"] = 1
-                        h["remain_length"] = setting.packet_time
-                    else:
-                        if not one_persistent:
-                            h["wait_time"] = random.randint(0, setting.max_collision_wait_time)
-        
-        ### Perform the action decided in the previous step
-        perform_action(setting, hosts, history)
-
-        ### Check for collisions and idle time
-        total_idle_time = check_collisions_and_idle_time(hosts, total_idle_time, history)
-
-        ###  Update the host's status and history
-        for h in hosts:
-            if h["status"] == 1:
-                if len(h["history"]) == 0 or (h["history"][-1] != "<" and h["history"][-1] != "-"):
-                    history[h["id"]] = "<"
-                else:
-                    history[h["id"]] = "-"
-                h["remain_length"] -= 1
-                if h["remain_length"] <= 0:
-                    if h["collision"]:
-                        h["wait_time"] = random.randint(0, setting.max_collision_wait_time)
-                        h["status"] = 0 # standby
-                        h["collision_num"] += 1
-                        history[h["id"]] = "|"
-                    else:
-                        h["status"] = 0
-                        h["success_num"] += 1
-                        h["packet_num"] -= 1
-                        history[h["id"]] = ">"
-                    h["collision"] = False
-            h["history"] += history[h["id"]]
-
-    print_history(setting, hosts, show_history)
-    return calculate_metrics(setting, hosts, total_idle_time)
-
-def csma_cd(setting, one_persistent=False, show_history=False):
-    hosts = init_hosts(setting)
-    packets_times = setting.gen_packets() # Generate packets for each host
-
-    total_idle_time = 0
-    for t in range(setting.total_time):
-        history = ["." for i in range(setting.host_num)]
-        
-        ### Generate packets for each host
-        for h in hosts:
-            if len(packets_times[h["id"]]) > 0 and packets_times[h["id"]][0] == t:
-                packets_times[h["id"]].pop(0)
-                h["packet_num"] += 1
-
-        ### Decide whether each host should send a packet
-        for h in hosts:
-            h["action_to_do"] = h["status"]
-            
-            if h["status"] == 0:
-                if h["wait_time"] > 0:
-                    h["wait_time"] -= 1
-
-                elif h["packet_num"] > 0:
-                    others_sending = False
-                    for others in hosts:
-                        if others["id"] == h["id"]:
-                            continue
-                        if (
-                            setting.link_delay >= 0
-                            and t > (setting.link_delay + 1)
-                            and (
-                                others["history"][t - (setting.link_delay + 1)] == "-"
-                                or others["history"][t - (setting.link_delay + 1)] == "<"
-                            )
-                        ):
-                            others_sending = True
-                    
-                    if not others_sending:
-                        h["action_to_do"] = 1
-                        h["remain_length"] = setting.packet_time
-                    else:
-                        if not one_persistent:
-                            h["wait_time"] = random.randint(0, setting.max_collision_wait_time)
-            
-            elif h["status"] == 1 :    # TODO:  change "xxx" to the correct protocol name
-                others_sending = False
-                for others in hosts:
-                    if others["id"] == h["id"]:
-                        continue
-                    if (
-                        setting.link_delay >= 0
-                        and t > (setting.link_delay + 1)
-                        and (
-                            others["history"][t - (setting.link_delay + 1)] == "-"
-                            or others["history"][t - (setting.link_delay + 1)] == "<"
-                        )
-                    ):
-                        others_sending = True
-                if others_sending:
-                    h["action_to_do"] = 3
-            
-        
-        ### Perform the action decided in the previous step
-        perform_action(setting, hosts, history)
-
-        ### Check for collisions and idle time
-        total_idle_time = check_collisions_and_idle_time(hosts, total_idle_time, history)
-
-        ###  Update the host's status and history
-        for h in hosts:
-            if h["status"] == 1:
-                if len(h["history"]) == 0 or (h["history"][-1] != "<" and h["history"][-1] != "-"):
-                    history[h["id"]] = "<"
-                else:
-                    history[h["id"]] = "-"
-                h["remain_length"] -= 1
-                if h["remain_length"] <= 0:
-                    if h["collision"]:
-                        h["wait_time"] = random.randint(0, setting.max_collision_wait_time)
-                        h["status"] = 0 # standby
-                        h["collision_num"] += 1
-                        history[h["id"]] = "|"
-                    else:
-                        h["status"] = 0
-                        h["success_num"] += 1
-                        h["packet_num"] -= 1
-                        history[h["id"]] = ">"
-                    h["collision"] = False
-            h["history"] += history[h["id"]]
-    
-    print_history(setting, hosts, show_history)
-    return calculate_metrics(setting, hosts, total_idle_time)
+                        h.status = STANDBY
+                        h.success_num += 1
+                        h.packet_num -= 1
+                        history[h.id] = ">"
+                        policy.on_success(setting, h.id)
+                        if monitor is not None:
+                            monitor.success(h.id, t)
+                    h.collision = False
+        if profiler is not None:
+            profiler.lap("update")
+        if record is not None:
+            record.record(history)
+        if policy.sensing:
+            channel.record(t, history)
+        if profiler is not None:
+            profiler.lap("history")
+        if monitor is not None and monitor.tick(t, total_idle_time):
+            elapsed = t + 1
+            break
+        if checkpoint is not None and checkpoint.due(t):
+            checkpoint.save(t, setting, hosts, arrivals, policy, channel, total_idle_time)
+            if t + 1 == checkpoint.until:
+                elapsed = t + 1
+                break
+        if profiler is not None:
+            profiler.lap("monitor_checkpoint")
+
+    if profiler is not None:
+        profiler.untime()
+    if profiler is not None and profiler is not setting.profile:
+        profiler.report()
+    print_history(setting, record, show_history)
+    return calculate_metrics(setting, hosts, total_idle_time, elapsed)
+
+
+def aloha(setting, show_history=False, record=None, monitor=None, checkpoint=None):
+    return simulate(setting, Aloha(), show_history, record, monitor, checkpoint)
+
+def slotted_aloha(setting, show_history=False, record=None, monitor=None, checkpoint=None):
+    return simulate(setting, SlottedAloha(), show_history, record, monitor, checkpoint)
+
+def csma(setting, one_persistent=False, show_history=False, record=None, monitor=None, checkpoint=None):
+    return simulate(setting, Csma(one_persistent), show_history, record, monitor, checkpoint)
+
+def csma_cd(setting, one_persistent=False, show_history=False, record=None, monitor=None, checkpoint=None):
+    return simulate(setting, CsmaCd(one_persistent), show_history, record, monitor, checkpoint)
+
+def csma_ca(setting, show_history=False, record=None, monitor=None, checkpoint=None):
+    return simulate(setting, CsmaCa(), show_history, record, monitor, checkpoint)
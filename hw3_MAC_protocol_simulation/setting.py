@@ -1,5 +1,9 @@
 import random
 
+import numpy as np
+
+from arrivals import gen_arrivals
+
 class Setting:
     """
     This class represents the settings for a network simulation.
@@ -13,9 +17,13 @@ class Setting:
         p_resend (float): slotted aloha 每個 slot 開始時，重送封包的機率
         link_delay (int): link delay
         seed (int): 用來產生一系列隨機數的 seed，若使用相同 seed 則會有一樣的模擬結果，若使用不同的seed，模擬結果則會不同
+        profile (bool | profiling.Profiler): 開啟後 protocols.py 會記錄每個階段 (arrivals, decide, perform_action, ...) 花的時間與呼叫次數並在模擬結束時印出，傳入 Profiler 則累加到該物件，不印出
+        arrival (str): 封包產生的方式，"uniform" 在模擬時間內不重複地抽出 packet_num 個時間點，"poisson" 每個時間單位的封包數為 Poisson 分佈，"bernoulli" 每個時間單位以固定機率產生一個封包，後兩者平均也是 packet_num 個封包
 
     Methods:
         gen_packets(): 產生各個 host 的所有待傳送封包的產生時間點
+        gen_arrivals(): 同 gen_packets，但每個 host 回傳一個以 cursor 讀取的 arrivals.Arrivals (排序好的 NumPy array)
+        replication_seeds(replications): 由 seed 衍生出 replications 個互相獨立的 seed，給 batch.replicate 做多次模擬
     """
 
     def __init__(
@@ -29,6 +37,8 @@ class Setting:
         coefficient=8,
         link_delay=1,
         seed=None,
+        arrival="uniform",
+        profile=False,
     ) -> None:
 
         self.host_num = host_num
@@ -38,6 +48,8 @@ class Setting:
         self.packet_time = packet_size + 2 * link_delay
         self.link_delay = link_delay
         self.coefficient = coefficient
+        self.arrival = arrival
+        self.profile = profile
 
         if max_collision_wait_time is None:
             self.max_collision_wait_time = host_num * self.packet_time * coefficient  # TODO: this is not complete, change this (hint: add two parameters)
@@ -62,11 +74,10 @@ class Setting:
         [30, 50, 60]]  - host 2
     """
     def gen_packets(self):
-        random.seed(self.seed)
-        packets = [[] for i in range(self.host_num)]
-        for i in range(self.host_num):
-            packets[i] = random.sample(
-                range(1, self.total_time - self.packet_time), self.packet_num
-            )
-            packets[i].sort()
-        return packets
+        return [a.times.tolist() for a in self.gen_arrivals()]
+
+    def gen_arrivals(self):
+        return gen_arrivals(self)
+
+    def replication_seeds(self, replications):
+        return np.random.SeedSequence(self.seed).generate_state(replications).tolist()
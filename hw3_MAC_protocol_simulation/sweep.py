@@ -0,0 +1,122 @@
+import copy
+import importlib
+import itertools
+import math
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+from setting import Setting
+
+PROTOCOLS = ("aloha", "slotted_aloha", "csma", "csma_cd")
+METRICS = ("success_rate", "idle_rate", "collision_rate")
+
+# two-sided 95% Student t quantiles for 1..30 degrees of freedom
+T_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def grid_settings(grid):
+    """
+    Expand a grid into a list of Setting.
+
+    `grid` is either a dict mapping Setting parameters to lists of values
+    (every combination is used), or a list whose items are Setting objects or
+    dicts of Setting parameters.
+    """
+    if isinstance(grid, dict):
+        keys = list(grid)
+        grid = [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    return [s if isinstance(s, Setting) else Setting(**s) for s in grid]
+
+
+def confidence_interval(samples):
+    ### Half width of the 95% confidence interval of the mean
+    if len(samples) < 2:
+        return 0.0
+    df = len(samples) - 1
+    t = T_95[df - 1] if df <= len(T_95) else 1.96
+    return t * statistics.stdev(samples) / math.sqrt(len(samples))
+
+
+def run_one(engine, protocol, setting):
+    ### Run one protocol on one setting, executed in a worker process
+    return getattr(importlib.import_module(engine), protocol)(setting)
+
+
+def sweep(grid, protocols=PROTOCOLS, seeds=None, engine="protocols", max_workers=None, half_width=None):
+    """
+    Run every protocol on every setting of `grid` for several seeds in parallel.
+
+    seeds: None runs each setting once with its own seed, an int K runs the
+    seeds 1..K and a list runs the given seeds. The same seeds are used for
+    every setting and protocol.
+    engine: module providing the protocol functions ("protocols",
+    "vectorized" or "event_driven").
+    half_width: size each setting's total_time (packet_num scaled with it)
+    with analytic.required_ticks so that the 95% confidence interval of every
+    protocol is about this wide, instead of using the setting's total_time.
+
+    Returns one row per (setting, protocol) with the mean and the 95%
+    confidence interval half width of each rate.
+    """
+    settings = grid_settings(grid)
+    if isinstance(seeds, int):
+        seeds = range(1, seeds + 1)
+    if half_width is not None:
+        import analytic
+
+        replications = 1 if seeds is None else len(seeds)
+        settings = [
+            analytic.scaled(s, max(analytic.required_ticks(s, p, half_width, replications) for p in protocols))
+            for s in settings
+        ]
+
+    jobs = []
+    for i, base in enumerate(settings):
+        for seed in ([base.seed] if seeds is None else seeds):
+            s = copy.copy(base)
+            s.seed = seed
+            for protocol in protocols:
+                jobs.append((i, protocol, s))
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        results = executor.map(
+            run_one,
+            [engine] * len(jobs),
+            [protocol for _, protocol, _ in jobs],
+            [s for _, _, s in jobs],
+            chunksize=max(1, len(jobs) // (4 * (max_workers or os.cpu_count()))),
+        )
+        samples = {}
+        for (i, protocol, _), result in zip(jobs, results):
+            samples.setdefault((i, protocol), []).append(result)
+
+    table = []
+    for i, s in enumerate(settings):
+        params = {k: v for k, v in vars(s).items() if k != "seed"}
+        for protocol in protocols:
+            runs = samples[(i, protocol)]
+            row = {"setting": i, **params, "protocol": protocol, "runs": len(runs)}
+            for k, metric in enumerate(METRICS):
+                values = [r[k] for r in runs]
+                row[metric] = statistics.fmean(values)
+                row[f"{metric}_ci"] = confidence_interval(values)
+            table.append(row)
+    return table
+
+
+def print_table(table, columns=("setting", "protocol") + METRICS):
+    ### Print a sweep table as "mean ± ci" columns
+    print("  ".join(f"{c:>22}" for c in columns))
+    for row in table:
+        cells = []
+        for c in columns:
+            if c in METRICS:
+                cells.append(f"{row[c]:.4f} ± {row[c + '_ci']:.4f}".rjust(22))
+            else:
+                cells.append(f"{row[c]!s:>22}")
+        print("  ".join(cells))
@@ -0,0 +1,267 @@
+import random
+
+import numpy as np
+
+from history import History
+from host import STANDBY, SEND, RESEND, STOP
+from policies import Aloha, SlottedAloha, Csma, CsmaCd, CsmaCa
+from protocols import print_history
+
+
+class HostArrays:
+    """
+    Host state of protocols.init_hosts, one NumPy array per field.
+
+    Index i of every array is host i, so a whole tick can be advanced with
+    array operations instead of a Python loop over host objects.
+    """
+
+    def __init__(self, setting):
+        n = setting.host_num
+        self.status = np.zeros(n, dtype=np.int8)
+        self.packet_num = np.zeros(n, dtype=np.int64)
+        self.remain_length = np.full(n, setting.total_time, dtype=np.int64)
+        self.wait_time = np.zeros(n, dtype=np.int64)
+        self.collision = np.zeros(n, dtype=bool)
+        self.success_num = np.zeros(n, dtype=np.int64)
+        self.collision_num = np.zeros(n, dtype=np.int64)
+        # True when the host wrote "<" or "-" in the current tick
+        self.sending = np.zeros(n, dtype=bool)
+
+
+def arrival_schedule(setting):
+    """
+    Flatten setting.gen_arrivals() into (ticks, hosts_per_tick).
+
+    ticks is the sorted list of distinct arrival ticks and hosts_per_tick[k]
+    the array of hosts receiving a packet at ticks[k], a host appearing once
+    per packet.
+    """
+    arrivals = setting.gen_arrivals()
+    times = np.concatenate([a.times for a in arrivals])
+    owners = np.repeat(np.arange(setting.host_num), [len(a.times) for a in arrivals])
+    order = np.argsort(times, kind="stable")
+    times, owners = times[order], owners[order]
+    ticks, starts = np.unique(times, return_index=True)
+    return ticks.tolist(), np.split(owners, starts[1:])
+
+
+def draw_backoff(setting, policy, hosts, idx):
+    ### Draw the backoff of the hosts in idx in host order, like the per-host loops do
+    for i in idx.tolist():
+        policy.on_collision(setting, i)
+        hosts.wait_time[i] = policy.backoff(setting, i)
+
+
+def draw_decisions(setting, policy, hosts, backoff, resend):
+    """
+    Draw the random numbers of the decide step in host order.
+
+    Hosts in `backoff` heard a busy channel and draw a wait_time, hosts in
+    `resend` draw against p_resend; returns the resending hosts that send.
+    """
+    resending = set(resend.tolist())
+    send = []
+    for i in sorted(backoff.tolist() + resend.tolist()):
+        if i in resending:
+            r = random.random()
+            if r < setting.p_resend:
+                send.append(i)
+        else:
+            hosts.wait_time[i] = policy.backoff(setting, i)
+    return send
+
+
+def quiet_ticks(setting, policy, hosts, t, next_arrival_tick):
+    """
+    Number of ticks from t on in which nothing can happen but idle time and
+    backoff countdowns: no host is sending or resending, no host is ready
+    to send, and no packet arrives before the first backoff with a packet
+    waiting behind it expires. The caller checks that the channel has been
+    idle for the last link_delay + 1 ticks, so carrier sense sees it idle.
+    """
+    if policy.resend and (hosts.status == RESEND).any():
+        return 0
+    queued = hosts.packet_num > 0
+    if (queued & (hosts.wait_time == 0)).any():
+        return 0
+    end = min(next_arrival_tick, setting.total_time)
+    if queued.any():
+        end = min(end, t + int(hosts.wait_time[queued].min()))
+    return max(end - t, 0)
+
+
+def simulate(setting, policy, show_history=False, record=None, monitor=None):
+    """
+    Run one MAC protocol, given as a policies.Policy, on host arrays.
+
+    Random numbers are drawn from the `random` module in the same order as
+    protocols.simulate, so the result is identical for the same seed.
+    Stretches of idle ticks are skipped in one step when no history or
+    monitor needs to see them tick by tick.
+    """
+    hosts = HostArrays(setting)
+    arrival_ticks, arrival_hosts = arrival_schedule(setting)
+    next_arrival = 0
+
+    policy.reset(setting)
+    no_one = np.zeros(setting.host_num, dtype=bool)
+    # busy_ring[s % (link_delay + 1)] holds hosts.sending of tick s
+    delay = setting.link_delay + 1
+    busy_ring = np.zeros((max(delay, 1), setting.host_num), dtype=bool)
+
+    if show_history and record is None:
+        record = History(setting.host_num)
+    total_idle_time = 0
+    elapsed = setting.total_time
+    # consecutive ticks without a sending or stopping host
+    idle_run = 0
+    t = -1
+    while t + 1 < setting.total_time:
+        t += 1
+        ### Skip a stretch where only backoffs count down
+        if idle_run >= delay and record is None and monitor is None:
+            next_arrival_tick = arrival_ticks[next_arrival] if next_arrival < len(arrival_ticks) else setting.total_time
+            skip = quiet_ticks(setting, policy, hosts, t, next_arrival_tick)
+            if skip > 0:
+                np.maximum(hosts.wait_time - skip, 0, out=hosts.wait_time)
+                total_idle_time += skip
+                idle_run += skip
+                t += skip
+                if t >= setting.total_time:
+                    break
+
+        ### Generate packets for each host
+        if next_arrival < len(arrival_ticks) and arrival_ticks[next_arrival] == t:
+            np.add.at(hosts.packet_num, arrival_hosts[next_arrival], 1)
+            if monitor is not None:
+                for i in arrival_hosts[next_arrival].tolist():
+                    monitor.arrival(i, t)
+            next_arrival += 1
+
+        ### Decide whether each host should send a packet
+        if policy.sensing and setting.link_delay >= 0 and t > delay:
+            busy = busy_ring[t % delay]
+            others_sending = (np.count_nonzero(busy) - busy) > 0
+        else:
+            others_sending = no_one
+
+        action_to_do = hosts.status.copy()
+        standby = hosts.status == STANDBY
+        waiting = standby & (hosts.wait_time > 0)
+        if policy.freeze_backoff:
+            hosts.wait_time[waiting & ~others_sending] -= 1
+        else:
+            hosts.wait_time[waiting] -= 1
+
+        if not policy.slotted or t % setting.packet_time == 0:
+            ready = standby & ~waiting & (hosts.packet_num > 0)
+            send = ready & ~others_sending
+            backoff = np.flatnonzero(ready & others_sending) if not policy.one_persistent else np.flatnonzero(no_one)
+            resend = np.flatnonzero(hosts.status == RESEND) if policy.resend else np.flatnonzero(no_one)
+            if len(backoff) > 0 or len(resend) > 0:
+                send[draw_decisions(setting, policy, hosts, backoff, resend)] = True
+            action_to_do[send] = SEND
+            hosts.remain_length[send] = setting.packet_time
+        if policy.collision_detection:
+            action_to_do[(hosts.status == SEND) & others_sending] = STOP
+
+        ### Perform the action decided in the previous step
+        stop = np.flatnonzero(action_to_do == STOP)
+        if len(stop) > 0:
+            hosts.collision[stop] = False
+            hosts.remain_length[stop] = 0
+            hosts.collision_num[stop] += 1
+            draw_backoff(setting, policy, hosts, stop)
+            action_to_do[stop] = STANDBY
+        hosts.status = action_to_do
+
+        ### Check for collisions and idle time
+        transmitting = hosts.status == SEND
+        sending_num = np.count_nonzero(transmitting)
+        if sending_num > 1:
+            hosts.collision |= transmitting
+        if sending_num == 0 and len(stop) == 0:
+            total_idle_time += 1
+            idle_run += 1
+        else:
+            idle_run = 0
+
+        ###  Update the host's status and history
+        prev_sending = hosts.sending
+        if sending_num > 0:
+            hosts.remain_length[transmitting] -= 1
+            done = transmitting & (hosts.remain_length <= 0)
+            hosts.sending = transmitting & ~done
+            collided_mask = done & hosts.collision
+            if done.any():
+                collided = np.flatnonzero(collided_mask)
+                succeeded = np.flatnonzero(done & ~hosts.collision)
+                if len(collided) > 0:
+                    hosts.collision_num[collided] += 1
+                    if policy.resend:
+                        for i in collided.tolist():
+                            policy.on_collision(setting, i)
+                        hosts.status[collided] = RESEND
+                    else:
+                        draw_backoff(setting, policy, hosts, collided)
+                        hosts.status[collided] = STANDBY
+                hosts.status[succeeded] = STANDBY
+                hosts.success_num[succeeded] += 1
+                hosts.packet_num[succeeded] -= 1
+                for i in succeeded.tolist():
+                    policy.on_success(setting, i)
+                    if monitor is not None:
+                        monitor.success(i, t)
+                hosts.collision[done] = False
+        else:
+            done = collided_mask = transmitting
+            hosts.sending = transmitting
+        if policy.sensing:
+            busy_ring[t % delay] = hosts.sending
+
+        if record is not None:
+            row = np.full(setting.host_num, ".", dtype="<U1")
+            row[transmitting] = "-"
+            row[transmitting & ~prev_sending] = "<"
+            row[done] = ">"
+            row[collided_mask] = "|"
+            row[stop] = "|"
+            record.record(row)
+        if monitor is not None and monitor.tick(t, total_idle_time):
+            elapsed = t + 1
+            break
+
+    print_history(setting, record, show_history)
+    return calculate_metrics(setting, hosts, total_idle_time, elapsed)
+
+
+def calculate_metrics(setting, hosts, total_idle_time, elapsed):
+    ### Calculate the success rate, idle rate, and collision rate over the elapsed ticks
+    total_success_time = int(hosts.success_num.sum()) * setting.packet_time
+    total_collision_time = elapsed - total_success_time - total_idle_time
+    return (
+        total_success_time / elapsed,
+        total_idle_time / elapsed,
+        total_collision_time / elapsed,
+    )
+
+
+def aloha(setting, show_history=False, record=None, monitor=None):
+    return simulate(setting, Aloha(), show_history, record, monitor)
+
+
+def slotted_aloha(setting, show_history=False, record=None, monitor=None):
+    return simulate(setting, SlottedAloha(), show_history, record, monitor)
+
+
+def csma(setting, one_persistent=False, show_history=False, record=None, monitor=None):
+    return simulate(setting, Csma(one_persistent), show_history, record, monitor)
+
+
+def csma_cd(setting, one_persistent=False, show_history=False, record=None, monitor=None):
+    return simulate(setting, CsmaCd(one_persistent), show_history, record, monitor)
+
+
+def csma_ca(setting, show_history=False, record=None, monitor=None):
+    return simulate(setting, CsmaCa(), show_history, record, monitor)
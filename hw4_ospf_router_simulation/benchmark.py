@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import timeit
+
+import ospf
+from emulator import emulate, grid_topology, random_topology, ring_topology
+from ospf import (
+    DBD, HELLO_PACKET, DBD_PACKET, LSR_PACKET, LSU_PACKET, TEXT_PACKET,
+    HelloPacket, LinkStateAdvertisement, LSAHeader, LSRPacket, LSUPacket, OSPFPacket,
+    decode_packet, encode_packet, pickle_bytes, unpickle_bytes,
+)
+
+
+def sample_packets(lsas=100, metrics=4, seed=1):
+    # One packet of each type, the DBD, LSR and LSU sized for an LSDB of `lsas` routers.
+    # received_time is left at 0.0 since the wire format does not carry it
+    rng = random.Random(seed)
+    lsa_list = [
+        LinkStateAdvertisement(i, rng.randint(1, 1000), {rng.randint(1, lsas): rng.randint(1, 100) for _ in range(metrics)}, 0.0)
+        for i in range(1, lsas + 1)
+    ]
+    return {
+        "hello": OSPFPacket(1, 2, HELLO_PACKET, 0, HelloPacket(1, True, False)),
+        "dbd": OSPFPacket(1, 2, DBD_PACKET, 0, DBD(1, 1, [LSAHeader(lsa.link_id, lsa.seq, rng.getrandbits(32)) for lsa in lsa_list])),
+        "lsr": OSPFPacket(1, 2, LSR_PACKET, 0, LSRPacket([lsa.link_id for lsa in lsa_list])),
+        "lsu": OSPFPacket(1, 2, LSU_PACKET, 0, LSUPacket(lsa_list)),
+        "text": OSPFPacket(1, 2, TEXT_PACKET, 11, b"hello world"),
+    }
+
+
+def wire(lsas=100, metrics=4, number=None):
+    """
+    Compare the binary wire format with pickle for every packet type.
+
+    Returns one row per (packet, codec) with bytes on the wire and encode /
+    decode throughput in packets per second.
+    """
+    codecs = {"pickle": (pickle_bytes, unpickle_bytes), "binary": (encode_packet, decode_packet)}
+    rows = []
+    for name, packet in sample_packets(lsas, metrics).items():
+        for codec, (encode, decode) in codecs.items():
+            data = encode(packet)
+            assert decode(data) == packet
+            n = number or max(10, 200_000 // len(data))
+            encode_time = min(timeit.repeat(lambda: encode(packet), number=n, repeat=3)) / n
+            decode_time = min(timeit.repeat(lambda: decode(data), number=n, repeat=3)) / n
+            rows.append({
+                "packet": name,
+                "codec": codec,
+                "bytes": len(data),
+                "encode_per_sec": 1 / encode_time,
+                "decode_per_sec": 1 / decode_time,
+            })
+    return rows
+
+
+def topology(kind, n):
+    if kind == "ring":
+        return ring_topology(n)
+    if kind == "grid":
+        side = max(1, round(math.sqrt(n)))
+        return grid_topology(side, max(2, round(n / side)))
+    return random_topology(n)
+
+
+def convergence(kinds=("ring", "grid", "random"), sizes=(16, 64), timeout=120):
+    """
+    Time emulated networks from addlink to convergence.
+
+    One row per (topology, size) with the time until every neighbor is Full
+    and until every routing table has the shortest paths, the messages and
+    bytes exchanged and the SPF runs and time of all routers. Grids are the
+    squarest grid of about `size` routers.
+    """
+    rows = []
+    for kind in kinds:
+        for n in sizes:
+            result = asyncio.run(emulate(topology(kind, n), timeout))
+            rows.append({
+                "topology": kind,
+                "routers": result["routers"],
+                "links": result["links"],
+                "full_time": result["full_time"],
+                "convergence_time": result["convergence_time"],
+                "messages": result["messages"],
+                "bytes": result["bytes"],
+                "spf_runs": result["spf_runs"],
+                "spf_time": result["spf_time"],
+            })
+    return rows
+
+
+def print_rows(rows):
+    columns = list(rows[0])
+    widths = [max(16, len(c) + 2) for c in columns]
+
+    def cell(value, width):
+        if isinstance(value, float):
+            return f"{value:>{width}.0f}" if value >= 100 else f"{value:>{width}.3f}"
+        return f"{value!s:>{width}}"
+
+    print("".join(f"{c:>{w}}" for c, w in zip(columns, widths)))
+    for row in rows:
+        print("".join(cell(row[c], w) for c, w in zip(columns, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OSPF router benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    wire_parser = commands.add_parser("wire", help="binary wire format vs pickle")
+    wire_parser.add_argument("--lsas", type=int, default=100, help="routers in the DBD, LSR and LSU")
+    wire_parser.add_argument("--metrics", type=int, default=4, help="links per LSA")
+    convergence_parser = commands.add_parser("convergence", help="time from addlink to converged routing tables")
+    convergence_parser.add_argument("--topology", nargs="+", choices=["ring", "grid", "random"], default=["ring", "grid", "random"])
+    convergence_parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64], help="routers per topology")
+    convergence_parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    if args.command == "wire":
+        rows = wire(args.lsas, args.metrics)
+    elif args.command == "convergence":
+        ospf.LOG_ENABLED = False
+        rows = convergence(args.topology, args.sizes, args.timeout)
+    print_rows(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import heapq
+import random
+
+import ospf
+from ospf import OSPFRouter, FULL_STATE, OSPF_ROUTE, PACKET_NAMES, VirtualClock, WallClock, start_timers
+
+
+def load_topology(path):
+    """
+    Read a topology file: one "router_id router_id cost" link per line.
+
+    Blank lines and lines starting with # are skipped. Links are
+    bidirectional with the same cost both ways.
+    """
+    links = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                a, b, cost = (int(x) for x in line.split())
+                links.append((a, b, cost))
+    return links
+
+
+def save_topology(links, path):
+    with open(path, "w") as f:
+        for a, b, cost in links:
+            f.write(f"{a} {b} {cost}\n")
+
+
+def random_topology(n, degree=3, max_cost=10, seed=1):
+    # Connected random topology: a random spanning tree plus extra links up to about `degree` per router
+    rng = random.Random(seed)
+    links = {}
+    order = list(range(1, n + 1))
+    rng.shuffle(order)
+    for i in range(1, n):
+        a, b = order[i], order[rng.randrange(i)]
+        links[min(a, b), max(a, b)] = rng.randint(1, max_cost)
+    while len(links) < min(n * degree // 2, n * (n - 1) // 2):
+        a, b = rng.sample(range(1, n + 1), 2)
+        links.setdefault((min(a, b), max(a, b)), rng.randint(1, max_cost))
+    return [(a, b, cost) for (a, b), cost in links.items()]
+
+
+def ring_topology(n, cost=1):
+    return [(i, i % n + 1, cost) for i in range(1, n + 1)] if n > 2 else [(1, 2, cost)]
+
+
+def grid_topology(rows, columns, cost=1):
+    # rows x columns routers numbered row by row, each linked to its right and lower neighbor
+    links = []
+    for r in range(rows):
+        for c in range(columns):
+            router_id = r * columns + c + 1
+            if c + 1 < columns:
+                links.append((router_id, router_id + 1, cost))
+            if r + 1 < rows:
+                links.append((router_id, router_id + columns, cost))
+    return links
+
+
+def shortest_costs(links, source):
+    # Cost from source to every reachable router, the routes a converged router must have
+    graph = {}
+    for a, b, cost in links:
+        graph.setdefault(a, []).append((b, cost))
+        graph.setdefault(b, []).append((a, cost))
+    distance = {source: 0}
+    heap = [(0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > distance[u]:
+            continue
+        for v, cost in graph.get(u, ()):
+            if d + cost < distance.get(v, float("inf")):
+                distance[v] = d + cost
+                heapq.heappush(heap, (d + cost, v))
+    del distance[source]
+    return distance
+
+
+def expected_costs(links):
+    return {router_id: shortest_costs(links, router_id) for router_id in {a for a, _, _ in links} | {b for _, b, _ in links}}
+
+
+class MemoryTransport:
+    # Stands in for a router's UDP socket, hands datagrams to the network
+    def __init__(self, network, router_id):
+        self.network = network
+        self.router_id = router_id
+
+    def sendto(self, data, address):
+        self.network.deliver(self.router_id, data, address[1] - 10000)
+
+
+class MemoryNetwork:
+    """
+    In-memory links between routers sharing one clock.
+
+    A datagram is delivered `latency` seconds later with the clock's
+    call_later to the router addressed by its port, the way the UDP socket
+    would. Datagrams to a router that does not exist are dropped. Counts
+    messages and bytes per packet type.
+    """
+
+    def __init__(self, clock, latency=0):
+        self.clock = clock
+        self.latency = latency
+        self.routers = {}
+        self.messages = {name: 0 for name in PACKET_NAMES.values()}
+        self.bytes = 0
+
+    def add_router(self, router_id):
+        router = OSPFRouter(router_id, bind=False, clock=self.clock)
+        router.transport = MemoryTransport(self, router_id)
+        self.routers[router_id] = router
+        return router
+
+    def deliver(self, source, data, destination):
+        name = PACKET_NAMES.get(data[1], "unknown")
+        self.messages[name] = self.messages.get(name, 0) + 1
+        self.bytes += len(data)
+        router = self.routers.get(destination)
+        if router is None:
+            return
+        self.clock.call_later(self.latency, router.datagram_received, data, ("127.0.0.1", 10000 + source))
+
+
+def converged(network, expected):
+    # Every neighbor Full and every router's OSPF routes at the shortest path costs
+    for router_id, router in network.routers.items():
+        if any(neighbor.state != FULL_STATE for neighbor in router.neighbors):
+            return False
+        routes = {entry.destination_router_id: entry.cost for entry in router.routing_table.table if entry.type == OSPF_ROUTE}
+        if routes != expected[router_id]:
+            return False
+    return True
+
+
+def start_network(links, clock, latency=0):
+    # One router per router of `links`, every link added with "addlink" on both ends at once and the timers started
+    network = MemoryNetwork(clock, latency)
+    router_ids = sorted({a for a, _, _ in links} | {b for _, b, _ in links})
+    for router_id in router_ids:
+        network.add_router(router_id)
+    for a, b, cost in links:
+        network.routers[a].handle_command(f"addlink {b} {cost}")
+        network.routers[b].handle_command(f"addlink {a} {cost}")
+    for router in network.routers.values():
+        start_timers(router)
+    return network
+
+
+def result(network, links, start, elapsed):
+    stats = [router.stats for router in network.routers.values()]
+    full_times = [t for s in stats for t, _, _, state in s.neighbor_transitions if state == FULL_STATE]
+    return {
+        "routers": len(network.routers),
+        "links": len(links),
+        "convergence_time": elapsed,
+        "full_time": max(full_times) - start if full_times else None,
+        "spf_runs": sum(s.spf_runs for s in stats),
+        "spf_time": sum(s.spf_time for s in stats),
+        "messages": sum(network.messages.values()),
+        "bytes": network.bytes,
+        **{f"{name}_messages": n for name, n in network.messages.items()},
+    }
+
+
+async def emulate(links, timeout=120, check_interval=0.1, latency=0):
+    """
+    Run one OSPFRouter per router of `links` on the running loop until
+    convergence.
+
+    Every link is added with "addlink" on both ends at once, then the
+    routers run on their timers until every router has every neighbor Full
+    and routing tables that match the shortest paths of the topology.
+    Returns the time from the addlinks to convergence (None on timeout),
+    the time until the last neighbor went Full, the messages and bytes
+    exchanged and the SPF runs and time of all routers until then.
+    """
+    clock = WallClock(asyncio.get_running_loop().call_later)
+    expected = expected_costs(links)
+    start = clock.time()
+    network = start_network(links, clock, latency)
+
+    elapsed = None
+    while clock.time() - start < timeout:
+        await asyncio.sleep(check_interval)
+        if converged(network, expected):
+            elapsed = clock.time() - start
+            break
+    return result(network, links, start, elapsed)
+
+
+def emulate_virtual(links, timeout=120, check_interval=0.1, latency=0, duration=None):
+    """
+    emulate() on a VirtualClock: the same run in simulated time, without
+    waiting for the timers and the same for every call.
+
+    With `duration` the routers keep running until `duration` simulated
+    seconds after the addlinks (LSA refreshes, SPF reruns), and
+    "converged_at_end" tells whether the routing tables still match then.
+    """
+    clock = VirtualClock()
+    expected = expected_costs(links)
+    start = clock.time()
+    network = start_network(links, clock, latency)
+
+    elapsed = None
+    while clock.time() - start < timeout:
+        clock.advance(check_interval)
+        if converged(network, expected):
+            elapsed = clock.time() - start
+            break
+    summary = result(network, links, start, elapsed)
+    if duration is not None:
+        clock.advance(max(start + duration - clock.time(), 0))
+        summary["converged_at_end"] = converged(network, expected)
+        summary["messages_at_end"] = sum(network.messages.values())
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many OSPF routers in one process")
+    parser.add_argument("topology", nargs="?", help="topology file, one 'router_id router_id cost' per line")
+    parser.add_argument("--random", type=int, nargs="+", metavar="N", help="random topologies of N routers instead of a file")
+    parser.add_argument("--degree", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--verbose", action="store_true", help="keep the routers' log output")
+    parser.add_argument("--virtual", action="store_true", help="run in simulated time instead of waiting for the timers")
+    parser.add_argument("--duration", type=float, help="with --virtual, keep running until this many simulated seconds")
+    args = parser.parse_args()
+    if args.topology is None and args.random is None:
+        parser.error("give a topology file or --random N")
+
+    ospf.LOG_ENABLED = args.verbose
+    topologies = [load_topology(args.topology)] if args.topology else [random_topology(n, args.degree) for n in args.random]
+    for links in topologies:
+        if args.virtual:
+            summary = emulate_virtual(links, args.timeout, duration=args.duration)
+        else:
+            summary = asyncio.run(emulate(links, args.timeout))
+        print(" ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in summary.items()))
@@ -1,9 +1,15 @@
 import sys
 import time
+import json
+import asyncio
+import heapq
 import socket
 import struct
+import itertools
 import pickle
+import random
 import threading
+import zlib
 from dataclasses import dataclass
 
 # OSPF packet types
@@ -13,6 +19,14 @@ LSR_PACKET = 3
 LSU_PACKET = 4
 TEXT_PACKET = 5
 
+PACKET_NAMES = {
+    HELLO_PACKET: "hello",
+    DBD_PACKET: "dbd",
+    LSR_PACKET: "lsr",
+    LSU_PACKET: "lsu",
+    TEXT_PACKET: "text",
+}
+
 # OSPF neighbor states
 DOWN_STATE = "Down"
 INIT_STATE = "Init"
@@ -29,8 +43,12 @@ def pickle_bytes(data):
 def unpickle_bytes(data):
     return pickle.loads(data)
 
+# the emulator turns logging off when it runs hundreds of routers
+LOG_ENABLED = True
+
 def logger(message):
-    print(f"{time.strftime('%H:%M:%S')} - {message}")
+    if LOG_ENABLED:
+        print(f"{time.strftime('%H:%M:%S')} - {message}")
 
 def debug(message):
     print(f"\033[1;32m[LOG] {time.strftime('%H:%M:%S')} - {message}\033[0m")
@@ -46,11 +64,25 @@ class LinkStateAdvertisement:
     def __str__(self):
         return f"LSA {self.link_id} {self.seq} {self.metrics}"
 
+@dataclass
+class LSAHeader:
+    link_id: int
+    seq: int
+    checksum: int
+
+    def newer_than(self, other):
+        # a higher seq wins, equal seqs are ordered by checksum (RFC 2328 13.1)
+        return other is None or (self.seq, self.checksum) > (other.seq, other.checksum)
+
+def lsa_checksum(metrics):
+    return zlib.crc32(repr(sorted(metrics.items())).encode())
+
 @dataclass
 class DBD:
     router_id: int
     sequence_number: int
-    link_state_advertisements: list[LinkStateAdvertisement]
+    lsa_headers: list[LSAHeader]
+    more: bool = False  # more parts of this DBD follow
 
 @dataclass
 class LSUPacket:
@@ -79,53 +111,284 @@ class OSPFPacket:
     packet_length: int
     packet_data: bytes
 
+# Binary wire format, all integers in network byte order:
+#   header  version B, packet_type B, source I, destination I, packet_length I
+#   HELLO   router_id I, flags B (1: already_seen, 2: ack)
+#   DBD     router_id I, sequence_number I, flags B (1: more), count I, count x (link_id I, seq I, checksum I)
+#   LSR     count I, count x router_id I
+#   LSU     count I, count x (link_id I, seq I, n I), then every LSA's neighbors I, then their costs i
+#           (received_time is not sent, the receiver stamps the LSA when it installs it)
+#   TEXT    message bytes
+WIRE_VERSION = 3
+MAX_DATAGRAM = 65507
+HEADER = struct.Struct("!BBIII")
+HELLO = struct.Struct("!IB")
+DBD_HEADER = struct.Struct("!IIBI")
+COUNT = struct.Struct("!I")
+LSA_HEADER = struct.Struct("!III")
+LSA_FIXED = struct.Struct("!III")
+
+def encode_lsu(lsas):
+    # column by column, so the whole LSU packs and unpacks in a few calls
+    header = [v for lsa in lsas for v in (lsa.link_id, lsa.seq, len(lsa.metrics))]
+    neighbors = [neighbor for lsa in lsas for neighbor in lsa.metrics]
+    costs = [cost for lsa in lsas for cost in lsa.metrics.values()]
+    n = len(neighbors)
+    return struct.pack(f"!I{len(header)}I{n}I{n}i", len(lsas), *header, *neighbors, *costs)
+
+def decode_lsu(data, offset):
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    # check the counts against the datagram before unpacking that many fields
+    if count > (len(data) - offset) // LSA_FIXED.size:
+        raise ValueError("truncated LSU")
+    header = struct.unpack_from(f"!{3 * count}I", data, offset)
+    offset += count * LSA_FIXED.size
+    sizes = header[2::3]
+    total = sum(sizes)
+    if total > (len(data) - offset) // 8:
+        raise ValueError("truncated LSU")
+    neighbors = struct.unpack_from(f"!{total}I", data, offset)
+    costs = struct.unpack_from(f"!{total}i", data, offset + 4 * total)
+    metrics = zip(neighbors, costs)
+    return LSUPacket([
+        LinkStateAdvertisement(link_id, seq, dict(itertools.islice(metrics, n)), 0.0)
+        for link_id, seq, n in zip(header[0::3], header[1::3], sizes)
+    ])
+
+def encode_packet(packet):
+    data = packet.packet_data
+    if packet.packet_type == HELLO_PACKET:
+        payload = HELLO.pack(data.router_id, data.already_seen | data.ack << 1)
+    elif packet.packet_type == DBD_PACKET:
+        headers = data.lsa_headers
+        payload = DBD_HEADER.pack(data.router_id, data.sequence_number, data.more, len(headers)) + b"".join(LSA_HEADER.pack(h.link_id, h.seq, h.checksum) for h in headers)
+    elif packet.packet_type == LSR_PACKET:
+        ids = data.request_router_ids
+        payload = COUNT.pack(len(ids)) + struct.pack(f"!{len(ids)}I", *ids)
+    elif packet.packet_type == LSU_PACKET:
+        lsas = data.link_state_advertisements
+        payload = encode_lsu(lsas)
+    elif packet.packet_type == TEXT_PACKET:
+        payload = data
+    else:
+        raise ValueError(f"unknown packet type {packet.packet_type}")
+    return HEADER.pack(WIRE_VERSION, packet.packet_type, packet.source_router_id, packet.destination_router_id, packet.packet_length) + payload
+
+def decode_packet(data):
+    # Inverse of encode_packet, raises ValueError on a malformed datagram
+    try:
+        version, packet_type, source, destination, packet_length = HEADER.unpack_from(data)
+        if version != WIRE_VERSION:
+            raise ValueError(f"unknown wire version {version}")
+        offset = HEADER.size
+        if packet_type == HELLO_PACKET:
+            router_id, flags = HELLO.unpack_from(data, offset)
+            payload = HelloPacket(router_id, bool(flags & 1), bool(flags & 2))
+        elif packet_type == DBD_PACKET:
+            router_id, sequence_number, flags, count = DBD_HEADER.unpack_from(data, offset)
+            offset += DBD_HEADER.size
+            end = offset + count * LSA_HEADER.size
+            if end > len(data):
+                raise ValueError("truncated DBD")
+            payload = DBD(router_id, sequence_number, [LSAHeader(*h) for h in LSA_HEADER.iter_unpack(data[offset:end])], bool(flags & 1))
+        elif packet_type == LSR_PACKET:
+            (count,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            if count > (len(data) - offset) // 4:
+                raise ValueError("truncated LSR")
+            payload = LSRPacket(list(struct.unpack_from(f"!{count}I", data, offset)))
+        elif packet_type == LSU_PACKET:
+            payload = decode_lsu(data, offset)
+        elif packet_type == TEXT_PACKET:
+            payload = bytes(data[offset:])
+        else:
+            raise ValueError(f"unknown packet type {packet_type}")
+    except struct.error as e:
+        raise ValueError(f"malformed packet: {e}") from e
+    return OSPFPacket(source, destination, packet_type, packet_length, payload)
+
+def thread_call_later(delay, callback, *args):
+    timer = threading.Timer(delay, callback, args)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+class WallClock:
+    # Real time; call_later starts a timer thread, or is loop.call_later under asyncio
+    def __init__(self, call_later=thread_call_later):
+        self.call_later = call_later
+
+    def time(self):
+        return time.time()
+
+class VirtualClock:
+    """
+    Simulated time for running routers without waiting.
+
+    call_later only queues the callback. advance(seconds) runs the callbacks
+    due within the next `seconds` in due order (ties in call order), setting
+    time() to each one's due time, so hours of hello, dead-interval and
+    refresh timers run as fast as the callbacks do, and the same calls
+    always give the same run.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.queue = []  # (due time, call number, callback, args)
+        self.calls = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback, *args):
+        heapq.heappush(self.queue, (self.now + max(delay, 0), next(self.calls), callback, args))
+
+    def advance(self, seconds):
+        end = self.now + seconds
+        while self.queue and self.queue[0][0] <= end:
+            due, _, callback, args = heapq.heappop(self.queue)
+            self.now = due
+            callback(*args)
+        self.now = end
+
 class LSDB:
-    def __init__(self, router_id):
+    """
+    LSAs indexed by link id.
+
+    Every entry also keeps the checksum of its metrics, so header() gives the
+    (link_id, seq, checksum) summary that DBDs carry without touching the
+    metrics. Full LSAs only travel in LSUs, answering LSRs or flooding.
+
+    Refreshes are kept in a heap keyed by due time: an LSA is due
+    `refresh_time` after it was received, plus a random jitter of up to
+    `refresh_jitter` of that, so LSAs learned together do not all refresh in
+    the same second. pop_due() only looks at the LSAs that are due.
+    """
+
+    def __init__(self, router_id, refresh_time=15, refresh_jitter=0.1, clock=None):
+        self.router_id = router_id
+        self.clock = clock or WallClock()
         self.lsas = {}
-        self.lsas[router_id] = LinkStateAdvertisement(router_id, 0, {}, time.time())
+        self.checksums = {}
+        # link ids whose LSA was added, changed or removed since the last SPF run
+        self.changed = set()
+        self.refresh_time = refresh_time
+        self.refresh_jitter = refresh_jitter
+        self.random = random.Random(router_id)
+        self.refresh_due = {}  # link id -> due time
+        self.refresh_heap = []  # (due time, link id), entries not in refresh_due are stale
+        self.set_lsa(LinkStateAdvertisement(router_id, 0, {}, self.clock.time()))
+
+    def set_lsa(self, lsa):
+        self.lsas[lsa.link_id] = lsa
+        self.checksums[lsa.link_id] = lsa_checksum(lsa.metrics)
+        self.changed.add(lsa.link_id)
+        self.schedule_refresh(lsa)
+
+    def schedule_refresh(self, lsa):
+        due = lsa.received_time + self.refresh_time * (1 + self.random.uniform(0, self.refresh_jitter))
+        self.refresh_due[lsa.link_id] = due
+        heapq.heappush(self.refresh_heap, (due, lsa.link_id))
+        if len(self.refresh_heap) > 2 * len(self.refresh_due) + 64:
+            # Drop the stale entries
+            self.refresh_heap = [(due, link_id) for link_id, due in self.refresh_due.items()]
+            heapq.heapify(self.refresh_heap)
+
+    def next_refresh(self):
+        # Due time of the first LSA to refresh, None with no LSA
+        heap = self.refresh_heap
+        while heap and self.refresh_due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_due(self, now):
+        # Link ids of the LSAs due for a refresh at `now`, unscheduled until refresh()
+        due = []
+        while (next_refresh := self.next_refresh()) is not None and next_refresh <= now:
+            link_id = heapq.heappop(self.refresh_heap)[1]
+            del self.refresh_due[link_id]
+            due.append(link_id)
+        return due
+
+    def refresh(self, link_id, now):
+        lsa = self.lsas[link_id]
+        lsa.seq += 1
+        lsa.received_time = now
+        self.schedule_refresh(lsa)
+        return lsa
+
+    def pop_changes(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def header(self, link_id):
+        lsa = self.lsas.get(link_id)
+        if lsa is None:
+            return None
+        return LSAHeader(link_id, lsa.seq, self.checksums[link_id])
+
+    def headers(self):
+        return [LSAHeader(link_id, lsa.seq, self.checksums[link_id]) for link_id, lsa in self.lsas.items()]
 
     def add_lsa(self, lsa):
-        if lsa.link_id in self.lsas:
-            existing_lsa = self.lsas[lsa.link_id]
-            if lsa.seq > existing_lsa.seq:
-                logger(f"update LSA {lsa.link_id} {lsa.seq}")
-                self.lsas[lsa.link_id] = lsa
-        else:
+        existing_lsa = self.lsas.get(lsa.link_id)
+        if existing_lsa is None:
             logger(f"add LSA {lsa.link_id} {lsa.seq}")
-            self.lsas[lsa.link_id] = lsa
+            self.set_lsa(lsa)
+        elif lsa.seq > existing_lsa.seq:
+            logger(f"update LSA {lsa.link_id} {lsa.seq}")
+            self.set_lsa(lsa)
+
+    def install(self, lsa):
+        """
+        Install a received LSA if it is newer than ours, return whether it was.
+
+        A newer copy of our own LSA (a neighbor refreshed it) is not taken;
+        ours is reissued with a higher seq instead so the network keeps our
+        metrics.
+        """
+        header = LSAHeader(lsa.link_id, lsa.seq, lsa_checksum(lsa.metrics))
+        if not header.newer_than(self.header(lsa.link_id)):
+            return False
+        if lsa.link_id == self.router_id:
+            own = self.lsas[self.router_id]
+            own.seq = lsa.seq + 1
+            own.received_time = self.clock.time()
+            self.schedule_refresh(own)
+            return True
+        self.set_lsa(LinkStateAdvertisement(lsa.link_id, lsa.seq, dict(lsa.metrics), self.clock.time()))
+        return True
 
     def update_lsa(self, router_id, metrics):
         if router_id in self.lsas:
             lsa = self.lsas[router_id]
             lsa.metrics = {**lsa.metrics, **metrics}
             lsa.seq += 1
-            lsa.received_time = time.time()
+            lsa.received_time = self.clock.time()
             logger(f"update LSA {router_id} {lsa.seq}")
+            self.set_lsa(lsa)
         else:
             logger(f"add LSA {router_id} 1")
-            self.lsas[router_id] = LinkStateAdvertisement(router_id, 1, metrics, time.time())
+            self.set_lsa(LinkStateAdvertisement(router_id, 1, metrics, self.clock.time()))
 
-    def update_lsa_on_basis(self, router_id, metrics):
-        if router_id in self.lsas:
-            lsa = self.lsas[router_id]
-            lsa.metrics = {**lsa.metrics, **metrics}
-            lsa.seq += 1
-            lsa.received_time = time.time()
-            # logger(f"update LSA {router_id} {lsa.seq}")
-        else:
-            # logger(f"add LSA {router_id} 1")
-            self.lsas[router_id] = LinkStateAdvertisement(router_id, 1, metrics, time.time())
+    def remove_link(self, router_id, neighbor_id):
+        lsa = self.lsas[router_id]
+        lsa.metrics = {k: v for k, v in lsa.metrics.items() if k != neighbor_id}
+        lsa.seq += 1
+        self.set_lsa(lsa)
 
     def remove_lsa(self, link_id):
-        if link_id in [lsa.link_id for lsa in self.lsas.values()]:
+        if link_id in self.lsas:
             logger(f"remove LSA {link_id}")
             del self.lsas[link_id]
+            del self.checksums[link_id]
+            self.refresh_due.pop(link_id, None)
+            self.changed.add(link_id)
 
     def get_lsa(self, link_id):
-        for lsa in self.lsas.values():
-            if lsa.link_id == link_id:
-                return lsa
-        return None
+        return self.lsas.get(link_id)
 
 @dataclass
 class RoutingTableEntry:
@@ -138,39 +401,351 @@ class RoutingTableEntry:
         return self.destination_router_id == other.destination_router_id and self.cost == other.cost and self.next_hop_router_id == other.next_hop_router_id and self.type == other.type
 
 class RoutingTable:
+    """
+    Routes indexed by type and destination, plus a FIB for forwarding.
+
+    fib maps each destination to the next hop of its preferred route
+    (STATIC_ROUTE before OSPF_ROUTE) and is only refreshed for the
+    destinations a change touches, so find_route is one dict lookup.
+    """
+
     def __init__(self):
-        self.table: list[RoutingTableEntry] = []
+        self.routes: dict[int, dict[int, RoutingTableEntry]] = {}  # type -> {destination: entry}
+        self.fib: dict[int, int] = {}  # destination -> next hop
+
+    @property
+    def table(self):
+        return [entry for type in sorted(self.routes) for entry in self.routes[type].values()]
+
+    def refresh_fib(self, destinations):
+        for destination in destinations:
+            for type in sorted(self.routes):
+                entry = self.routes[type].get(destination)
+                if entry is not None:
+                    self.fib[destination] = entry.next_hop_router_id
+                    break
+            else:
+                self.fib.pop(destination, None)
+
+    def lookup(self, destination):
+        return self.fib.get(destination, -1)
+
+    def add(self, entry):
+        routes = self.routes.setdefault(entry.type, {})
+        if entry.destination_router_id in routes:
+            logger(f"update route {entry.destination_router_id} {entry.next_hop_router_id} {entry.cost}")
+        else:
+            logger(f"add route {entry.destination_router_id} {entry.next_hop_router_id} {entry.cost}")
+        routes[entry.destination_router_id] = entry
+        self.refresh_fib([entry.destination_router_id])
 
     def update(self, type, new_table):
-        old_table = [entry for entry in self.table if entry.type == type]
-        for new_entry in new_table:
-            if new_entry not in old_table:
-                if new_entry.destination_router_id not in [entry.destination_router_id for entry in old_table]:
-                    logger(f"add route {new_entry.destination_router_id} {new_entry.next_hop_router_id} {new_entry.cost}")
-                else:
-                    logger(f"update route {new_entry.destination_router_id} {new_entry.next_hop_router_id} {new_entry.cost}")
-        for old_entry in old_table:
-            if old_entry.destination_router_id not in [entry.destination_router_id for entry in new_table]:
-                logger(f"remove route {old_entry.destination_router_id}")
-        self.table = new_table
+        old_routes = self.routes.get(type, {})
+        new_routes = {entry.destination_router_id: entry for entry in new_table}
+        for destination, new_entry in new_routes.items():
+            old_entry = old_routes.get(destination)
+            if old_entry is None:
+                logger(f"add route {new_entry.destination_router_id} {new_entry.next_hop_router_id} {new_entry.cost}")
+            elif old_entry != new_entry:
+                logger(f"update route {new_entry.destination_router_id} {new_entry.next_hop_router_id} {new_entry.cost}")
+        for destination in old_routes:
+            if destination not in new_routes:
+                logger(f"remove route {destination}")
+        # as before, the new table replaces the routes of the other types too
+        changed = set(new_routes)
+        for routes in self.routes.values():
+            changed.update(routes)
+        self.routes = {type: new_routes}
+        self.refresh_fib(changed)
 
     def remove(self, type, router_id):
-        self.table = [entry for entry in self.table if not (entry.type == type and entry.destination_router_id == router_id)]
+        self.routes.get(type, {}).pop(router_id, None)
+        self.refresh_fib([router_id])
         logger(f"remove route {router_id}")
 
+class ShortestPathTree:
+    """
+    Shortest path tree rooted at one router, updated incrementally.
+
+    set_links() replaces the links of one router (the metrics of its LSA)
+    and remembers which links changed. update() then only recomputes the
+    routers whose path used a link that got worse or disappeared (the
+    subtree below that link) and spreads the links that got better, with a
+    binary heap instead of a linear scan for the closest router.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.links: dict[int, dict[int, int]] = {}     # router id -> {neighbor id: cost}
+        self.in_links: dict[int, dict[int, int]] = {}  # router id -> {router id linking to it: cost}
+        self.distance = {root: 0}
+        self.parent = {root: None}
+        self.next_hop = {root: root}
+        self.changed_links = []  # (router id, neighbor id, old cost, new cost), None for no link
+        self.changed_routers = set()
+
+    def set_links(self, router_id, metrics):
+        # Replace the links of router_id, metrics None removes the router
+        old = self.links.get(router_id, {})
+        new = {} if metrics is None else dict(metrics)
+        for neighbor_id in old.keys() | new.keys():
+            old_cost, new_cost = old.get(neighbor_id), new.get(neighbor_id)
+            if old_cost == new_cost:
+                continue
+            self.changed_links.append((router_id, neighbor_id, old_cost, new_cost))
+            if new_cost is None:
+                del self.in_links[neighbor_id][router_id]
+            else:
+                self.in_links.setdefault(neighbor_id, {})[router_id] = new_cost
+        if metrics is None:
+            if router_id in self.links:
+                del self.links[router_id]
+                self.changed_routers.add(router_id)
+        else:
+            if router_id not in self.links:
+                self.changed_routers.add(router_id)
+            self.links[router_id] = new
+
+    def update(self):
+        # Apply the changed links, return the routers whose distance, next hop or LSA changed
+        # links that got worse or disappeared invalidate the subtree below them
+        invalid = set()
+        for router_id, neighbor_id, old_cost, new_cost in self.changed_links:
+            if self.parent.get(neighbor_id) == router_id and (new_cost is None or old_cost is None or new_cost > old_cost):
+                stack = [neighbor_id]
+                while stack:
+                    v = stack.pop()
+                    if v in invalid:
+                        continue
+                    invalid.add(v)
+                    stack.extend(w for w in self.links.get(v, ()) if self.parent.get(w) == v)
+        for v in invalid:
+            del self.distance[v], self.parent[v], self.next_hop[v]
+
+        # candidate paths into the invalidated routers and over the links that got better
+        heap = []
+        for v in invalid:
+            for u, cost in self.in_links.get(v, {}).items():
+                if u in self.distance:
+                    heap.append((self.distance[u] + cost, v, u))
+        for router_id, neighbor_id, old_cost, new_cost in self.changed_links:
+            # a link can change several times between two updates, use its cost now
+            cost = self.links.get(router_id, {}).get(neighbor_id)
+            if cost is not None and router_id in self.distance:
+                heap.append((self.distance[router_id] + cost, neighbor_id, router_id))
+        heapq.heapify(heap)
+        self.changed_links = []
+
+        changed = self.changed_routers | invalid
+        self.changed_routers = set()
+        while heap:
+            d, v, u = heapq.heappop(heap)
+            if d >= self.distance.get(v, float("inf")):
+                continue
+            self.distance[v] = d
+            self.parent[v] = u
+            self.next_hop[v] = v if u == self.root else self.next_hop[u]
+            changed.add(v)
+            for w, cost in self.links.get(v, {}).items():
+                if d + cost < self.distance.get(w, float("inf")):
+                    heapq.heappush(heap, (d + cost, w, v))
+        return changed
+
+class SPFScheduler:
+    """
+    Throttle SPF runs with an initial delay, a hold time and exponential backoff.
+
+    trigger() asks for an SPF run. The first trigger after a quiet period
+    runs after initial_delay; every trigger while a run is pending is
+    coalesced into it. A trigger soon after a run waits until `hold` seconds
+    after that run, and the hold doubles with every such run up to
+    max_wait. After max_wait seconds without a run the hold is reset.
+    """
+
+    def __init__(self, run, initial_delay=0.05, hold=0.2, max_wait=5.0, clock=None):
+        self.run = run
+        self.initial_delay = initial_delay
+        self.hold = hold
+        self.max_wait = max_wait
+        self.clock = clock or WallClock()
+        self.current_hold = hold
+        self.last_run = None
+        self.pending = False
+        self.lock = threading.Lock()
+        self.triggers = 0
+        self.runs = 0
+
+    @property
+    def coalesced(self):
+        return self.triggers - self.runs - self.pending
+
+    def trigger(self):
+        with self.lock:
+            self.triggers += 1
+            if self.pending:
+                return
+            self.pending = True
+            now = self.clock.time()
+            if self.last_run is None or now - self.last_run >= self.max_wait:
+                self.current_hold = self.hold
+                delay = self.initial_delay
+            else:
+                delay = max(self.initial_delay, self.last_run + self.current_hold - now)
+                self.current_hold = min(self.current_hold * 2, self.max_wait)
+        self.clock.call_later(delay, self.run_now)
+
+    def run_now(self):
+        with self.lock:
+            self.pending = False
+            self.runs += 1
+            self.last_run = self.clock.time()
+        self.run()
+
+def lsu_batches(lsas, mtu):
+    # Split lsas into lists whose LSU datagram fits in mtu bytes (an LSA larger than mtu goes alone)
+    batch, size = [], HEADER.size + COUNT.size
+    for lsa in lsas:
+        lsa_size = LSA_FIXED.size + 8 * len(lsa.metrics)
+        if batch and size + lsa_size > mtu:
+            yield batch
+            batch, size = [], HEADER.size + COUNT.size
+        batch.append(lsa)
+        size += lsa_size
+    if batch:
+        yield batch
+
+def dbd_batches(headers, mtu):
+    # split LSA headers into DBD parts that fit in mtu bytes, at least one part
+    per_part = max(1, (mtu - HEADER.size - DBD_HEADER.size) // LSA_HEADER.size)
+    return [headers[i:i + per_part] for i in range(0, len(headers), per_part)] or [[]]
+
+class FloodQueue:
+    """
+    Batched and paced LSA flooding.
+
+    enqueue() marks an LSA as due to every Full neighbor. Once per `interval`
+    flush() packs each neighbor's due LSAs into LSUs of at most `mtu` bytes
+    and sends up to `burst` of them, leaving the rest for the next flush. The
+    LSDB's current copy is sent, so an LSA queued several times goes once,
+    and nothing is sent that the neighbor is known to hold already: LSAs it
+    sent us, LSAs in its last DBD and LSAs we already sent it.
+    """
+
+    def __init__(self, router, interval=0.05, mtu=1400, burst=4):
+        self.router = router
+        self.interval = interval
+        self.mtu = mtu
+        self.burst = burst
+        self.pending: dict[int, dict[int, None]] = {}  # neighbor id -> link ids, in queueing order
+        self.known: dict[int, dict[int, LSAHeader]] = {}  # neighbor id -> {link id: newest header it holds}
+        self.scheduled = False
+        self.lsus_sent = 0
+        self.lsas_sent = 0
+        self.suppressed = 0
+
+    def learned(self, neighbor_id, header):
+        # The neighbor holds this instance of an LSA
+        known = self.known.setdefault(neighbor_id, {})
+        if header.newer_than(known.get(header.link_id)):
+            known[header.link_id] = header
+
+    def forget(self, neighbor_id):
+        # Drop what is queued for and known about a neighbor that was removed or went Down
+        self.pending.pop(neighbor_id, None)
+        self.known.pop(neighbor_id, None)
+
+    def enqueue(self, link_id, exclude=None):
+        for neighbor in self.router.neighbors:
+            if neighbor.state == FULL_STATE and neighbor.router_id != exclude:
+                self.pending.setdefault(neighbor.router_id, {})[link_id] = None
+        if self.pending and not self.scheduled:
+            self.scheduled = True
+            self.router.clock.call_later(self.interval, self.scheduled_flush)
+
+    def scheduled_flush(self):
+        with self.router.lock:
+            self.scheduled = False
+            self.flush()
+            if self.pending and not self.scheduled:
+                self.scheduled = True
+                self.router.clock.call_later(self.interval, self.scheduled_flush)
+
+    def flush(self):
+        full = {neighbor.router_id for neighbor in self.router.neighbors if neighbor.state == FULL_STATE}
+        for neighbor_id in list(self.pending):
+            if neighbor_id not in full:
+                del self.pending[neighbor_id]
+                continue
+            known = self.known.setdefault(neighbor_id, {})
+            lsas = []
+            for link_id in self.pending.pop(neighbor_id):
+                header = self.router.lsdb.header(link_id)
+                if header is None or not header.newer_than(known.get(link_id)):
+                    self.suppressed += 1
+                    continue
+                lsas.append(self.router.lsdb.get_lsa(link_id))
+            batches = list(lsu_batches(lsas, self.mtu))
+            for batch in batches[:self.burst]:
+                self.router.send_lsu(neighbor_id, batch)
+                self.lsus_sent += 1
+                self.lsas_sent += len(batch)
+                for lsa in batch:
+                    known[lsa.link_id] = self.router.lsdb.header(lsa.link_id)
+            left = [lsa.link_id for batch in batches[self.burst:] for lsa in batch]
+            if left:
+                self.pending[neighbor_id] = dict.fromkeys(left)
+
+class RouterStats:
+    """
+    Counters of one router: packets and bytes sent and received per packet
+    type, SPF runs and time, and every neighbor state change. The `stats`
+    command prints them with the LSDB and routing table sizes as JSON.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.started = clock.time()
+        self.packets_sent = dict.fromkeys(PACKET_NAMES.values(), 0)
+        self.packets_received = dict.fromkeys(PACKET_NAMES.values(), 0)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.dropped = 0  # datagrams that failed to decode
+        self.spf_runs = 0
+        self.spf_time = 0.0
+        self.neighbor_transitions = []  # (time, neighbor id, old state, new state)
+
+    def sent(self, packet_type, size):
+        name = PACKET_NAMES.get(packet_type, "unknown")
+        self.packets_sent[name] = self.packets_sent.get(name, 0) + 1
+        self.bytes_sent += size
+
+    def received(self, packet_type, size):
+        name = PACKET_NAMES.get(packet_type, "unknown")
+        self.packets_received[name] = self.packets_received.get(name, 0) + 1
+        self.bytes_received += size
+
+    def neighbor_changed(self, neighbor_id, old_state, new_state):
+        self.neighbor_transitions.append((self.clock.time(), neighbor_id, old_state, new_state))
+
 class Neighbor:
-    def __init__(self, router_id, cost):
+    def __init__(self, router_id, cost, stats=None):
         self.router_id = router_id
         self.cost = cost
         self.state = DOWN_STATE
         self.dbd = None
+        # sequence number of the DBD being received and whether any part of it asked for LSAs
+        self.dbd_sequence = None
+        self.dbd_diff = False
         self.last_seen = 0
+        self.stats = stats
 
     def update_state(self, new_state):
         old_state = self.state
         self.state = new_state
         if old_state != new_state:
             logger(f"Neighbor {self.router_id} state set to {new_state}")
+            if self.stats is not None:
+                self.stats.neighbor_changed(self.router_id, old_state, new_state)
 
     def update_dbd(self, dbd):
         self.dbd = dbd
@@ -180,17 +755,37 @@ class OSPFRouter:
     DBD_INTERVAL = 1
     DEAD_INTERVAL = 4 * HELLO_INTERVAL
     LSA_REFRESH_TIME = 15
+    LSA_REFRESH_JITTER = 0.1
+    SPF_INITIAL_DELAY = 0.05
+    SPF_HOLD = 0.2
+    SPF_MAX_WAIT = 5
+    FLOOD_INTERVAL = 0.05
+    FLOOD_MTU = 1400
+    FLOOD_BURST = 4
 
-    def __init__(self, router_id):
+    def __init__(self, router_id, bind=True, clock=None):
         self.router_id = router_id
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_socket.bind(("127.0.0.1", 10000 + router_id))
-        self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        # where the timers and timestamps come from: WallClock, or a
+        # VirtualClock to run simulated time
+        self.clock = clock or WallClock()
+        # anything with sendto(data, address): the bound UDP socket of the
+        # threaded runtime, or the transport the asyncio runtime sets
+        self.transport = None
+        if bind:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind(("127.0.0.1", 10000 + router_id))
+            self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self.transport = self.udp_socket
         self.neighbors = []
         self.routing_table = RoutingTable()
-        self.lsdb = LSDB(router_id)
-        # topology is represented as adjacency list
-        self.topology: dict[int, list[tuple[int, int]]] = {}
+        self.lsdb = LSDB(router_id, self.LSA_REFRESH_TIME, self.LSA_REFRESH_JITTER, self.clock)
+        self.spf_tree = ShortestPathTree(router_id)
+        self.spf_scheduler = SPFScheduler(self.scheduled_spf, self.SPF_INITIAL_DELAY, self.SPF_HOLD, self.SPF_MAX_WAIT, self.clock)
+        self.flood_queue = FloodQueue(self, self.FLOOD_INTERVAL, self.FLOOD_MTU, self.FLOOD_BURST)
+        self.stats = RouterStats(self.clock)
+        self.dbd_sequence = 0
+        # held while handling a packet, a command or a scheduled SPF run or flush
+        self.lock = threading.RLock()
 
     def find_neighbor(self, router_id):
         for neighbor in self.neighbors:
@@ -198,100 +793,106 @@ class OSPFRouter:
                 return neighbor
         return None
 
-    def construct_topology(self):
-        lsas = list(self.lsdb.lsas.values())
-        # debug(f"LSAs: {lsas}")
-        for lsa in lsas:
-            self.topology[lsa.link_id] = []
-            for neighbor in lsa.metrics:
-                self.topology[lsa.link_id].append((neighbor, lsa.metrics[neighbor]))
-        # debug(f"Topology: {self.topology}")
+    def scheduled_spf(self):
+        with self.lock:
+            self.run_spf()
 
     def run_spf(self):
         if not any(neighbor.state == FULL_STATE for neighbor in self.neighbors):
             return
-        self.construct_topology()
-        # lsas = [lsa for lsa in self.lsdb.lsas.values() if lsa.link_id not in neighbors]
-
-        # Dijkstra's algorithm
-        visited = set()
-        all_nodes = set()
-        for router_id in self.topology:
-            all_nodes.add(router_id)
-            for neighbor, _ in self.topology[router_id]:
-                all_nodes.add(neighbor)
-        distance = {router_id: float("inf") for router_id in all_nodes}
-        distance[self.router_id] = 0
-        previous = {router_id: None for router_id in all_nodes}
-
-        while len(visited) < len(self.topology):
-            min_distance = float("inf")
-            min_router_id = None
-            for router_id in self.topology:
-                if router_id not in visited and distance[router_id] < min_distance:
-                    min_distance = distance[router_id]
-                    min_router_id = router_id
-            if min_router_id is None:
-                break
-            if min_router_id not in self.topology:
-                continue
-            visited.add(min_router_id)
-            for neighbor, cost in self.topology[min_router_id]:
-                if distance[min_router_id] + cost < distance[neighbor]:
-                    distance[neighbor] = distance[min_router_id] + cost
-                    previous[neighbor] = min_router_id
+        changed = self.lsdb.pop_changes()
+        if not changed:
+            return
+        start = time.perf_counter()
+        self.stats.spf_runs += 1
+        for link_id in changed:
+            lsa = self.lsdb.get_lsa(link_id)
+            self.spf_tree.set_links(link_id, None if lsa is None else lsa.metrics)
+        if not self.spf_tree.update():
+            self.stats.spf_time += time.perf_counter() - start
+            return
 
+        tree = self.spf_tree
         new_routing_table = []
-        for router_id in self.topology:
+        for router_id in tree.links:
             if router_id == self.router_id:
                 continue
-            if distance[router_id] != float("inf"):
-                next_hop = previous[router_id]  
-                while previous[next_hop] != self.router_id and previous[next_hop] is not None:
-                    next_hop = previous[next_hop]
-                if next_hop == self.router_id:
-                    next_hop = router_id
-                new_routing_table.append(RoutingTableEntry(router_id, next_hop, distance[router_id], OSPF_ROUTE))
+            if router_id in tree.distance:
+                new_routing_table.append(RoutingTableEntry(router_id, tree.next_hop[router_id], tree.distance[router_id], OSPF_ROUTE))
 
         self.routing_table.update(OSPF_ROUTE, new_routing_table)
+        self.stats.spf_time += time.perf_counter() - start
 
     def send_hello(self, neighbor, already_seen=False, ack=False):
         hello_packet = HelloPacket(self.router_id, already_seen, ack)
         packet = OSPFPacket(self.router_id, neighbor.router_id, 1, 0, hello_packet)
         self.send_packet(packet)
 
+    def hello_tick(self):
+        for neighbor in self.neighbors:
+            if neighbor.state == DOWN_STATE:
+                self.send_hello(neighbor)
+            else:
+                self.send_hello(neighbor, already_seen=True)
+
+    def dead_tick(self):
+        now = self.clock.time()
+        for neighbor in self.neighbors:
+            if neighbor.state != DOWN_STATE and now - neighbor.last_seen > self.DEAD_INTERVAL:
+                neighbor.update_state(DOWN_STATE)
+                self.flood_queue.forget(neighbor.router_id)
+                # stop advertising the link until the neighbor is heard from again
+                self.lsdb.remove_link(self.router_id, neighbor.router_id)
+                self.flood_queue.enqueue(self.router_id)
+                self.spf_scheduler.trigger()
+
     def send_hello_job(self):
         while True:
-            for neighbor in self.neighbors:
-                if neighbor.state == DOWN_STATE:
-                    self.send_hello(neighbor)
-                else:
-                    self.send_hello(neighbor, already_seen=True)
+            with self.lock:
+                self.hello_tick()
+                self.dead_tick()
             time.sleep(self.HELLO_INTERVAL)
 
     def send_dbd(self, neighbor):
-        dbd_packet = DBD(self.router_id, 1, list(self.lsdb.lsas.values()))
-        packet = OSPFPacket(self.router_id, neighbor.router_id, DBD_PACKET, 0, dbd_packet)
-        self.send_packet(packet)
+        # one DBD per round, split into parts that share its sequence number
+        self.dbd_sequence += 1
+        parts = dbd_batches(self.lsdb.headers(), self.FLOOD_MTU)
+        for i, headers in enumerate(parts):
+            dbd_packet = DBD(self.router_id, self.dbd_sequence, headers, i + 1 < len(parts))
+            packet = OSPFPacket(self.router_id, neighbor.router_id, DBD_PACKET, 0, dbd_packet)
+            self.send_packet(packet)
+
+    def dbd_tick(self):
+        for neighbor in self.neighbors:
+            if neighbor.state == EXCHANGE_STATE or neighbor.state == FULL_STATE:
+                # debug(f"Send DBD to {neighbor.router_id}")
+                self.send_dbd(neighbor)
 
     def send_dbd_job(self):
         while True:
-            for neighbor in self.neighbors:
-                if neighbor.state == EXCHANGE_STATE or neighbor.state == FULL_STATE:
-                    # debug(f"Send DBD to {neighbor.router_id}")
-                    self.send_dbd(neighbor)
+            with self.lock:
+                self.dbd_tick()
             time.sleep(self.DBD_INTERVAL)
 
+    def lsa_refresh_tick(self):
+        now = self.clock.time()
+        for link_id in self.lsdb.pop_due(now):
+            self.lsdb.refresh(link_id, now)
+            self.flood_queue.enqueue(link_id)
+
+    def lsa_refresh_delay(self):
+        # Seconds until the next LSA is due, at most LSA_REFRESH_TIME since an LSA set meanwhile is due after that
+        next_refresh = self.lsdb.next_refresh()
+        if next_refresh is None:
+            return self.LSA_REFRESH_TIME
+        return min(max(next_refresh - self.clock.time(), 0), self.LSA_REFRESH_TIME)
+
     def check_lsa_job(self):
         while True:
-            for lsa in self.lsdb.lsas.values():
-                if time.time() - lsa.received_time > self.LSA_REFRESH_TIME:
-                    lsa.received_time = time.time()
-                    lsa.seq += 1
-                    for neighbor in self.neighbors:
-                        if neighbor.state == FULL_STATE:
-                            self.send_lsu(neighbor.router_id, [lsa])
-            time.sleep(1)
+            with self.lock:
+                self.lsa_refresh_tick()
+                delay = self.lsa_refresh_delay()
+            time.sleep(delay)
 
     def send_lsr(self, router_id, router_ids):
         lsr_packet = LSRPacket(router_ids)
@@ -308,26 +909,44 @@ class OSPFRouter:
         self.send_packet(packet)
 
     def find_route(self, router_id):
-        candidate = []
-        for entry in self.routing_table.table:
-            if entry.destination_router_id == router_id:
-                # return entry.next_hop_router_id
-                candidate.append(entry)
-        next_hop = -1
         # STATIC_ROUTE has higher priority
-        sorted_candidate = sorted(candidate, key=lambda x: x.type)
-        if sorted_candidate:
-            next_hop = sorted_candidate[0].next_hop_router_id
-        return next_hop
+        return self.routing_table.lookup(router_id)
 
     def send_packet(self, packet):
         # debug(f"Send {packet.packet_type} packet to {packet.destination_router_id}")
         next_hop = self.find_route(packet.destination_router_id) if packet.packet_type == TEXT_PACKET else packet.destination_router_id
-        self.udp_socket.sendto(
-            pickle_bytes(packet),
+        data = encode_packet(packet)
+        self.stats.sent(packet.packet_type, len(data))
+        self.transport.sendto(
+            data,
             ("127.0.0.1", 10000 + next_hop)
         )
 
+    def stats_dict(self):
+        # The counters of self.stats plus the current LSDB, routing table, SPF scheduler and flooding state
+        stats = self.stats
+        return {
+            "router_id": self.router_id,
+            "uptime": self.clock.time() - stats.started,
+            "packets_sent": stats.packets_sent,
+            "packets_received": stats.packets_received,
+            "bytes_sent": stats.bytes_sent,
+            "bytes_received": stats.bytes_received,
+            "dropped": stats.dropped,
+            "spf_runs": stats.spf_runs,
+            "spf_time": stats.spf_time,
+            "spf_triggers": self.spf_scheduler.triggers,
+            "spf_coalesced": self.spf_scheduler.coalesced,
+            "lsdb_size": len(self.lsdb.lsas),
+            "routes": {"static": len(self.routing_table.routes.get(STATIC_ROUTE, {})), "ospf": len(self.routing_table.routes.get(OSPF_ROUTE, {}))},
+            "flood": {"lsus_sent": self.flood_queue.lsus_sent, "lsas_sent": self.flood_queue.lsas_sent, "suppressed": self.flood_queue.suppressed},
+            "neighbors": {neighbor.router_id: neighbor.state for neighbor in self.neighbors},
+            "neighbor_transitions": [
+                {"time": t - stats.started, "neighbor": neighbor_id, "from": old_state, "to": new_state}
+                for t, neighbor_id, old_state, new_state in stats.neighbor_transitions
+            ],
+        }
+
     def handle_packet(self, packet):
         # logger(f"Received packet from {packet.source_router_id}")
         if packet.destination_router_id != self.router_id:
@@ -352,12 +971,13 @@ class OSPFRouter:
         if cmds[0] == "addlink":
             neighbor_id = int(cmds[1])
             cost = int(cmds[2])
-            neighbor = Neighbor(neighbor_id, cost)
+            neighbor = Neighbor(neighbor_id, cost, self.stats)
             self.neighbors.append(neighbor)
             logger(f"add neighbor {neighbor_id} {cost}")
             # self.lsdb.add_lsa(LinkStateAdvertisement(self.router_id, 1, {neighbor_id: cost}, time.time()))
             self.lsdb.update_lsa(self.router_id, {neighbor_id: cost})
-            self.routing_table.update(STATIC_ROUTE, self.routing_table.table + [RoutingTableEntry(neighbor_id, neighbor_id, cost, STATIC_ROUTE)])
+            self.flood_queue.enqueue(self.router_id)
+            self.routing_table.add(RoutingTableEntry(neighbor_id, neighbor_id, cost, STATIC_ROUTE))
             
         elif cmds[0] == "setlink":
             neighbor_id = int(cmds[1])
@@ -366,6 +986,7 @@ class OSPFRouter:
             if neighbor is not None:
                 neighbor.cost = cost
                 self.lsdb.update_lsa(self.router_id, {neighbor_id: cost})
+                self.flood_queue.enqueue(self.router_id)
                 logger(f"update neighbor {neighbor_id} {cost}")
         elif cmds[0] == "rmlink":
             neighbor_id = int(cmds[1])
@@ -377,26 +998,42 @@ class OSPFRouter:
 
 
             self.lsdb.remove_lsa(neighbor_id)
-            self.lsdb.get_lsa(self.router_id).metrics = {k: v for k, v in self.lsdb.get_lsa(self.router_id).metrics.items() if k != neighbor_id}
+            self.lsdb.remove_link(self.router_id, neighbor_id)
+            self.flood_queue.forget(neighbor_id)
+            self.flood_queue.enqueue(self.router_id)
             self.routing_table.remove(STATIC_ROUTE, neighbor_id)
-            self.run_spf()
+            self.spf_scheduler.trigger()
             
         elif cmds[0] == "send":
             router_id = int(cmds[1])
             msg = " ".join(cmds[2:])
-            if router_id in range(1, 100):
+            if router_id >= 1:
                 self.send_message(router_id, msg)
             else:
                 print("Invalid router id")
+        elif cmds[0] == "stats":
+            # stats [path]: print the counters as JSON, or write them to path
+            stats = json.dumps(self.stats_dict(), indent=2)
+            if len(cmds) > 1:
+                with open(cmds[1], "w") as f:
+                    f.write(stats)
+            else:
+                print(stats)
         elif cmds[0] == "exit":
             sys.exit(0)
 
     def handle_hello_packet(self, packet, pkt_info):
-        if packet.ack:
-            return
         neighbor = self.find_neighbor(pkt_info.source_router_id)
         if neighbor is None:
             return
+        neighbor.last_seen = self.clock.time()
+        if neighbor.router_id not in self.lsdb.get_lsa(self.router_id).metrics:
+            # the neighbor was declared dead, advertise the link again
+            self.lsdb.update_lsa(self.router_id, {neighbor.router_id: neighbor.cost})
+            self.flood_queue.enqueue(self.router_id)
+            self.spf_scheduler.trigger()
+        if packet.ack:
+            return
         if neighbor.state != FULL_STATE:
             # self.lsdb.update_lsa(self.router_id, {neighbor_id: cost})
             if packet.already_seen:
@@ -413,23 +1050,27 @@ class OSPFRouter:
 
         dbd = packet
         neighbor.update_dbd(dbd)
+        if dbd.sequence_number != neighbor.dbd_sequence:
+            neighbor.dbd_sequence = dbd.sequence_number
+            neighbor.dbd_diff = False
         diff = []
-        for lsa in dbd.link_state_advertisements:
-            # if self.lsdb.get_lsa(lsa.link_id) != lsa:
-            if self.lsdb.get_lsa(lsa.link_id) is None or self.lsdb.get_lsa(lsa.link_id).seq < lsa.seq:
-                diff.append(lsa.link_id)
+        for header in dbd.lsa_headers:
+            self.flood_queue.learned(neighbor.router_id, header)
+            if header.newer_than(self.lsdb.header(header.link_id)):
+                diff.append(header.link_id)
         # debug(f"DBD diff: {diff} from {neighbor.router_id}")
 
         # check if the neighbor is in the exchange state
         if diff:
+            neighbor.dbd_diff = True
             self.send_lsr(neighbor.router_id, diff)
-        else:
+        elif not dbd.more and not neighbor.dbd_diff:
+            # Full once a whole DBD asked for nothing
             neighbor.update_state(FULL_STATE)
-            self.run_spf()
+            self.spf_scheduler.trigger()
 
     def handle_lsr_packet(self, packet, pkt_info):
         lsr = packet
-        neighbor = self.find_neighbor(pkt_info.source_router_id)
         # debug(f"Received LSR packet: {lsr}")
         requested_lsas = []
         for lsa in lsr.request_router_ids:
@@ -437,36 +1078,88 @@ class OSPFRouter:
             # debug(f"Requested LSA {lsa}, found {requested_lsa}")
             if requested_lsa is not None:
                 requested_lsas.append(requested_lsa)
-        if requested_lsas:
-            self.send_lsu(neighbor.router_id, requested_lsas)
+        for batch in lsu_batches(requested_lsas, self.FLOOD_MTU):
+            self.send_lsu(pkt_info.source_router_id, batch)
 
     def handle_lsu_packet(self, packet, pkt_info):
         lsu = packet
-        neighbor = self.find_neighbor(pkt_info.source_router_id)
         # debug(f"Received LSU packet: {lsu}")
-        updated_lsas = []
         for lsa in lsu.link_state_advertisements:
-            existing_lsa = self.lsdb.get_lsa(lsa.link_id)
-            if existing_lsa is None or lsa.seq > existing_lsa.seq:
-                # self.lsdb.add_lsa(lsa)
-                self.lsdb.update_lsa_on_basis(lsa.link_id, lsa.metrics)
-                for neighbor in self.neighbors:
-                    if neighbor.state == FULL_STATE:
-                        self.send_lsu(neighbor.router_id, updated_lsas)
+            self.flood_queue.learned(pkt_info.source_router_id, LSAHeader(lsa.link_id, lsa.seq, lsa_checksum(lsa.metrics)))
+            if self.lsdb.install(lsa):
+                self.flood_queue.enqueue(lsa.link_id, exclude=pkt_info.source_router_id)
+
+        self.spf_scheduler.trigger()
 
-        self.run_spf()
+    def datagram_received(self, data, addr):
+        try:
+            packet = decode_packet(data)
+        except ValueError as e:
+            debug(f"Drop packet from {addr}: {e}")
+            self.stats.dropped += 1
+            return
+        with self.lock:
+            self.stats.received(packet.packet_type, len(data))
+            self.handle_packet(packet)
 
     def udp_socket_job(self):
         while True:
-            data, addr = self.udp_socket.recvfrom(1024)
-            packet = unpickle_bytes(data)
-            self.handle_packet(packet)
+            data, addr = self.udp_socket.recvfrom(MAX_DATAGRAM)
+            self.datagram_received(data, addr)
+
+class OSPFProtocol(asyncio.DatagramProtocol):
+    def __init__(self, router):
+        self.router = router
+
+    def connection_made(self, transport):
+        self.router.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.router.datagram_received(data, addr)
+
+def every(call_later, interval, callback):
+    # Run callback now and then every interval seconds
+    def tick():
+        callback()
+        call_later(interval, tick)
+    tick()
+
+def start_timers(router):
+    """
+    Drive a router from timers of its clock instead of the *_job threads.
+
+    Under asyncio the clock is WallClock(loop.call_later) and with a
+    VirtualClock the timers run as it is advanced; either way the SPF
+    scheduler and flood queue use the same clock, so all state changes
+    happen on one thread.
+    """
+    call_later = router.clock.call_later
+    every(call_later, router.HELLO_INTERVAL, router.hello_tick)
+    every(call_later, router.HELLO_INTERVAL, router.dead_tick)
+    every(call_later, router.DBD_INTERVAL, router.dbd_tick)
+
+    def lsa_refresh():
+        router.lsa_refresh_tick()
+        call_later(router.lsa_refresh_delay(), lsa_refresh)
+    lsa_refresh()
+
+async def run_async(router_id):
+    loop = asyncio.get_running_loop()
+    router = OSPFRouter(router_id, bind=False, clock=WallClock(loop.call_later))
+    await loop.create_datagram_endpoint(lambda: OSPFProtocol(router), local_addr=("127.0.0.1", 10000 + router_id))
+    start_timers(router)
+    while True:
+        command = await loop.run_in_executor(None, input, "Enter a command: ")
+        router.handle_command(command)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python ospf.py <router_id>")
+    if len(sys.argv) not in (2, 3) or sys.argv[2:] not in ([], ["--asyncio"]):
+        print("Usage: python ospf.py <router_id> [--asyncio]")
         sys.exit(1)
     router_id = int(sys.argv[1])
+    if sys.argv[2:] == ["--asyncio"]:
+        asyncio.run(run_async(router_id))
+        sys.exit(0)
     router = OSPFRouter(router_id)
     hello_thread = threading.Thread(target=router.send_hello_job, daemon=True)
     hello_thread.start()
@@ -478,4 +1171,5 @@ if __name__ == "__main__":
     lsa_thread.start()
     while True:
         command = input("Enter a command: ")
-        router.handle_command(command)
+        with router.lock:
+            router.handle_command(command)